@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+from lib.db_utils import ReadWrite, configure, query_all
+from lib.rate_limit import RateLimiter
+from lib.replay import FixtureArchive, StandIn
+from requests import Response
+import argparse
+import json
+import os
+import tempfile
+import time
+
+STATS_URL = 'https://sports.core.api.espn.com/v2/sports/football/leagues/nfl/seasons/2022/types/2/athletes/{}/statistics/0'
+
+
+def synthetic_archive(directory: str, athletes: int) -> list:
+    """Records the mock athlete stats response under a range of fake ESPN IDs
+    so the fetch layer can be benchmarked without a recorded run
+    """
+    archive = FixtureArchive(directory)
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps(ReadWrite(
+        './update/mocks/raw_stats.json').read()).encode('utf8')
+    urls = [STATS_URL.format(athlete) for athlete in range(athletes)]
+    for url in urls:
+        archive.save(url, response)
+    return urls
+
+
+def main():
+    """To Run: python3 -m bench.fetch --latency 0.05 --workers 1 8 32
+        Times query_all against a local StandIn serving either a recorded
+        archive (--archive) or a synthetic one built from the update mocks
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the fetch layer')
+    parser.add_argument('--archive', help='a recorded fixture archive')
+    parser.add_argument('--athletes', type=int, default=500,
+                        help='size of the synthetic archive')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate', type=float,
+                        help='rate limit the client to this many requests per second')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 8, 16, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.archive:
+            archive = FixtureArchive(args.archive)
+            urls = [ReadWrite(os.path.join(args.archive, name)).read()['url']
+                    for name in sorted(os.listdir(args.archive)) if name.endswith('.json')]
+        else:
+            archive = FixtureArchive(directory)
+            urls = synthetic_archive(directory, args.athletes)
+
+        server = StandIn(archive, latency=args.latency, jitter=args.jitter,
+                         error_rate=args.error_rate).start()
+        print(f'{len(urls)} urls, {args.latency}s latency, {args.error_rate} error rate')
+        for workers in args.workers:
+            limiter = RateLimiter(args.rate, concurrency=workers) if args.rate else None
+            client = configure(standin=server.url, backoff=0.05, limiter=limiter)
+            start = time.perf_counter()
+            results = query_all({url: url for url in urls}, workers)
+            elapsed = time.perf_counter() - start
+            empty = sum(1 for result in results.values() if not result)
+            print(f'workers={workers:<3} {elapsed:7.2f}s  '
+                  f'{len(urls) / elapsed:8.1f} req/s  {empty} empty')
+            if limiter:
+                print(f'            {limiter.report()}')
+            print(f'            {client.report().splitlines()[0]}')
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
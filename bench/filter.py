@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from lib.constants import Files, Lists
+from lib.db_utils import ReadWrite
+from unittest import mock
+import process.data_processing as process
+import argparse
+import itertools
+import json
+import time
+
+POSITIONS = ['quarterback', 'running back', 'wide receiver', 'tight end',
+             'free safety', 'middle linebacker', 'left guard']
+
+
+def league(scale: int):
+    """Builds scale copies of the week 7 mock's ~1,800 athletes, each given
+    a team from the depth chart mock and a position in turn
+    """
+    week = ReadWrite('./process/mocks/week_7.json').read()
+    depth_chart = ReadWrite('./process/mocks/depth_chart.json').read()
+    teams = itertools.cycle(depth_chart)
+    positions = itertools.cycle(POSITIONS + Lists.defense_positions[:3])
+    stats, details = {}, {}
+    for copy in range(scale):
+        for athlete, values in week.items():
+            key = athlete if copy == 0 else f'{athlete}-{copy}'
+            stats[key] = values
+            details[key] = {'team': next(teams), 'position': next(positions)}
+    return stats, details, depth_chart
+
+
+def per_player(stats, details, depth_chart):
+    with mock.patch.object(Files, 'STATS', stats), \
+            mock.patch.object(Files, 'DEPTH_CHART', depth_chart):
+        return {player: process.filter_stats(
+            stats[player], details[player]['position'], details[player]['team'])
+            for player in stats if details.get(player)}
+
+
+def timed(function, repeat: int, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    """To Run: python3 -m bench.filter --scale 10
+        Times filtering a league of scale x the week 7 mock's athletes one
+        player at a time with filter_stats against filter_league, and
+        checks both write the same filtered_stats.json
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark per player against whole league stat filtering')
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    stats, details, depth_chart = league(args.scale)
+    print(f'{len(stats)} athletes')
+    slow, expected = timed(per_player, args.repeat, stats, details, depth_chart)
+    fast, test = timed(process.filter_league, args.repeat, stats, details, depth_chart)
+    same = json.dumps(test) == json.dumps(expected)
+    print(f'filter_stats  {slow:6.3f}s')
+    print(f'filter_league {fast:6.3f}s  ({slow / fast:.1f}x faster)  '
+          f'{"same" if same else "DIFFERENT"}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from bs4 import BeautifulSoup
+from lib.db_utils import HTML_PARSER
+import update.data_formatting as formatter
+import argparse
+import time
+
+
+def timed_parse(page: str, parser: str, parse_only, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = formatter.schedule(BeautifulSoup(
+            page, parser, parse_only=parse_only).find_all('h4'), 'regular')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    """To Run: python3 -m bench.schedule --html ./update/mocks/raw_schedule.html
+        Times formatting a CBS schedule page from a full html.parser tree
+        against the SCHEDULE_TAGS only parse update_schedule uses, and
+        checks both give the same schedule
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark parsing the CBS schedule page')
+    parser.add_argument('--html', default='./update/mocks/raw_schedule.html')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.html, encoding='utf8') as hf:
+        page = hf.read()
+    print(f'{len(page) / 1024:.0f} KB page')
+    full, expected = timed_parse(page, 'html.parser', None, args.repeat)
+    print(f'html.parser, whole page  {full * 1000:7.2f}ms')
+    for name in dict.fromkeys(['html.parser', HTML_PARSER]):
+        fast, test = timed_parse(
+            page, name, formatter.SCHEDULE_TAGS, args.repeat)
+        print(f'{name + ", tables only":<24} {fast * 1000:7.2f}ms  '
+              f'{full / fast:4.1f}x  {"same" if test == expected else "DIFFERENT"}')
+
+
+if __name__ == "__main__":
+    main()
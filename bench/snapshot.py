@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+from lib.db_utils import ReadWrite
+import lib.db_utils as db_utils
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+def timed_reads(paths: list, snapshots: bool) -> float:
+    db_utils.SNAPSHOTS = snapshots
+    start = time.perf_counter()
+    for path in paths:
+        ReadWrite(path).read()
+    return time.perf_counter() - start
+
+
+def main():
+    """To Run: python3 -m bench.snapshot --weeks 18
+        Builds a full season of weekly stat snapshots from the week 7 mock
+        (~1,800 athletes each) plus stats.json, then times reading all of
+        them from json against reading their marshal snapshots
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark ReadWrite json reads against marshal snapshots')
+    parser.add_argument('--db', help='time a copy of an existing db directory instead')
+    parser.add_argument('--weeks', type=int, default=18)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.db:
+            # copied so the db itself is left as it was, sidecars and all
+            paths = []
+            for root, _, names in os.walk(args.db):
+                for name in names:
+                    if name.endswith('.json'):
+                        path = os.path.join(directory, os.path.relpath(
+                            os.path.join(root, name), args.db))
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        shutil.copyfile(os.path.join(root, name), path)
+                        paths.append(path)
+            for path in paths:
+                ReadWrite(path, ReadWrite(path).read()).write()
+        else:
+            week = ReadWrite('./process/mocks/week_7.json').read()
+            paths = [os.path.join(directory, f'week_{n}.json')
+                     for n in range(1, args.weeks + 1)]
+            paths.append(os.path.join(directory, 'stats.json'))
+            for path in paths:
+                ReadWrite(path, week).write()
+
+        size = sum(os.path.getsize(path) for path in paths) / 2**20
+        print(f'{len(paths)} files, {size:.1f} MB of json')
+        json_time = min(timed_reads(paths, False) for _ in range(args.repeat))
+        snapshot_time = min(timed_reads(paths, True)
+                            for _ in range(args.repeat))
+        print(f'json     {json_time:6.3f}s')
+        print(f'snapshot {snapshot_time:6.3f}s  ({json_time / snapshot_time:.1f}x faster)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+from lib.db_utils import ReadWrite
+from json import dump, load
+from typing import Dict, List
+import numpy as np
+import argparse
+import glob
+import os
+
+
+class WeeklySnapshot:
+    """A weekly stat snapshot (db/{YEAR}_stats/week_N.json) stored by column.
+    week_N.npy holds a stat x athlete float64 matrix, NaN where an athlete
+    has no value for a stat, and week_N.index.json holds the athlete ID and
+    stat name for each column and row. The matrix is memory mapped so reading
+    a few stats only touches those rows on disk. The index is stamped with
+    the json's version when it was written, and a copy whose json has been
+    written since doesn't count as existing, so the json is read instead.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): the json snapshot this stands in for, e.g.
+            ./db/2022_stats/week_7.json
+        """
+        base = path[:-5] if path.endswith('.json') else path
+        self.path = f'{base}.json'
+        self.values_path = f'{base}.npy'
+        self.index_path = f'{base}.index.json'
+        self._values = None
+        self._athletes = None
+        self._stats = None
+
+    def _source(self):
+        """The json's version (see ReadWrite.version), None without one
+        """
+        try:
+            version = ReadWrite(self.path).version()
+        except FileNotFoundError:
+            return None
+        # a list so it compares equal after a round trip through json
+        return list(version) if isinstance(version, tuple) else version
+
+    def exists(self) -> bool:
+        """Whether the columnar copy is there and still matches the json,
+        when there is one
+        """
+        if not (os.path.exists(self.values_path) and os.path.exists(self.index_path)):
+            return False
+        source = self._source()
+        if source is None:
+            return True
+        with open(self.index_path) as jf:
+            return load(jf).get('source') == source
+
+    def write(self, stats: Dict) -> None:
+        """Stores a snapshot in the same shape as update.main.update_stats builds
+
+        Args:
+            stats (Dict): ESPN ID -> stat name -> value
+        """
+        athletes = list(stats)
+        names = list(dict.fromkeys(
+            name for athlete in stats.values() for name in athlete))
+        rows = {name: i for i, name in enumerate(names)}
+        values = np.full((len(names), len(athletes)), np.nan)
+        for column, athlete in enumerate(athletes):
+            for name, value in stats[athlete].items():
+                values[rows[name], column] = np.nan if value is None else value
+
+        # always plain files next to each other, whichever backend ReadWrite uses
+        tmp = f'{self.values_path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as vf:
+            np.save(vf, values)
+        os.replace(tmp, self.values_path)
+        tmp = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf8') as jf:
+            dump({'athletes': athletes, 'stats': names, 'source': self._source()}, jf)
+        os.replace(tmp, self.index_path)
+        self._values = None
+
+    def _load(self) -> None:
+        if self._values is None:
+            with open(self.index_path) as jf:
+                index = load(jf)
+            self._athletes = index['athletes']
+            self._stats = {name: i for i, name in enumerate(index['stats'])}
+            self._values = np.load(self.values_path, mmap_mode='r')
+
+    @property
+    def athletes(self) -> List[str]:
+        self._load()
+        return self._athletes
+
+    @property
+    def stats(self) -> List[str]:
+        self._load()
+        return list(self._stats)
+
+    def column(self, stat: str) -> np.ndarray:
+        """Returns one stat for every athlete, in the order of self.athletes
+        (NaN where missing)
+        """
+        self._load()
+        if stat not in self._stats:
+            return np.full(len(self._athletes), np.nan)
+        return np.asarray(self._values[self._stats[stat]])
+
+    def matrix(self) -> np.ndarray:
+        """Returns the whole stat x athlete matrix, rows in the order of
+        self.stats and columns in the order of self.athletes
+        """
+        self._load()
+        return np.asarray(self._values)
+
+    def to_dict(self) -> Dict:
+        """Rebuilds the full json snapshot
+
+        Returns:
+            Dict: ESPN ID -> stat name -> value
+        """
+        self._load()
+        names = list(self._stats)
+        columns = np.asarray(self._values).T.tolist()
+        return {athlete: {name: value for name, value in zip(names, columns[i]) if value == value}
+                for i, athlete in enumerate(self._athletes)}
+
+    def export_json(self) -> None:
+        stats = self.to_dict()
+        ReadWrite(self.path, stats).write()
+        # stamped again with the json just written
+        self.write(stats)
+
+
+def main():
+    """To Run: python3 -m lib.columnar convert ./db/2022_stats
+        convert stores every week_N.json in the directory by column as well,
+        export writes week_N.json back out from each columnar snapshot
+    """
+    parser = argparse.ArgumentParser(
+        description='Convert weekly stat snapshots between json and columnar')
+    parser.add_argument('command', choices=['convert', 'export'])
+    parser.add_argument('directory')
+    args = parser.parse_args()
+
+    pattern = 'week_*.npy' if args.command == 'export' else 'week_*.json'
+    for path in sorted(glob.glob(os.path.join(args.directory, pattern))):
+        if path.endswith('.index.json'):
+            continue
+        snapshot = WeeklySnapshot(os.path.splitext(path)[0])
+        if args.command == 'convert':
+            snapshot.write(ReadWrite(path).read())
+        else:
+            snapshot.export_json()
+        print(f'{args.command}ed {snapshot.path}')
+
+
+if __name__ == "__main__":
+    main()
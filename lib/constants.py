@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
 from dataclasses import dataclass
-from lib.db_utils import ReadWrite
+from lib.db_utils import LazyFile
 
 
 @dataclass
 class Inputs:
     WEEK = 11  # the most recent completed week
     YEAR = 2022
-    if WEEK > 17:
+    # the regular season is 18 weeks long from 2021 on, 17 before
+    if WEEK > (17 if YEAR <= 2020 else 18):
         SEASON = 'postseason'
         SEASON_VAL = 3
     else:
@@ -17,18 +18,76 @@ class Inputs:
     URL = 'https://sports.core.api.espn.com/v2/sports/football/leagues/nfl/seasons/'
 
 
+@dataclass(frozen=True)
+class RunContext:
+    """The season and week a run works on. The update and process stages
+    take one so a backfill can run many weeks at once, and fall back to
+    Inputs when they aren't given one.
+    """
+    YEAR: int
+    WEEK: int
+
+    @classmethod
+    def current(cls) -> 'RunContext':
+        return cls(Inputs.YEAR, Inputs.WEEK)
+
+    @property
+    def REGULAR_WEEKS(self) -> int:
+        """The regular season's length, 18 weeks from 2021 on and 17 before
+        """
+        return 17 if self.YEAR <= 2020 else 18
+
+    @property
+    def SEASON(self) -> str:
+        return 'postseason' if self.WEEK > self.REGULAR_WEEKS else 'regular'
+
+    @property
+    def SEASON_VAL(self) -> int:
+        return 3 if self.WEEK > self.REGULAR_WEEKS else 2
+
+    @property
+    def SEASON_WEEK(self) -> int:
+        """The week within the season type, postseason weeks start over at 1
+        """
+        return self.WEEK - self.REGULAR_WEEKS if self.WEEK > self.REGULAR_WEEKS else self.WEEK
+
+    def stats_path(self, week: int = None) -> str:
+        """The weekly stat snapshot of a week, this run's week by default
+        """
+        return f'./db/{self.YEAR}_stats/week_{self.WEEK if week is None else week}.json'
+
+
+@dataclass
+class Settings:
+    WORKERS = 16  # concurrent requests when fetching athletes
+    RATE_LIMIT = None  # e.g. 25 requests per second to ESPN and CBS (lib.rate_limit)
+    INCREMENTAL = False  # carry forward stats of athletes who didn't play
+    STAGE_WORKERS = 4  # update and process stages allowed to run at once
+    BENCHMARK_PERCENTILES = [50, 75, 90, 99]  # written to db/benchmark_percentiles.json
+    BENCHMARK_SKETCHES = False  # keep multi season percentiles in db/benchmark_history.json
+    HTTP_CACHE = None  # e.g. './db/http_cache' to cache responses (lib.http_cache)
+    HTTP_CACHE_MB = 512
+    HTTP_MODE = None  # 'record' or 'replay' the fixture archive
+    FIXTURES = './db/fixtures'
+    STANDIN = None  # e.g. 'http://127.0.0.1:8000' from python3 -m lib.replay
+    COLUMNAR = True  # also store weekly stat snapshots by column (lib.columnar)
+    BACKEND = 'json'  # or 'sqlite' after python3 -m lib.sqlite_store
+    SQLITE = './db/nfl.sqlite'
+
+
 @dataclass
 class Files:
-    STATS = ReadWrite('./db/stats.json').read()
-    BENCHMARKS = ReadWrite('./db/benchmark_stats.json').read()
-    DETAILS = ReadWrite('./db/player_details.json').read()
-    DEPTH_CHART = ReadWrite('./db/depth_chart.json').read()
-    SCHEDULE = ReadWrite('./db/schedule.json').read()
-    FILTERED_STATS = ReadWrite('./db/filtered_stats.json').read()
-    PROCESSED_STATS = ReadWrite('./db/processed_stats.json').read()
-    RESULTS = ReadWrite('./db/results.json').read()
-    TIMESTAMPS = ReadWrite('./db/timestamps.json').read()
-    INJURIES = ReadWrite('./db/injuries.json').read()
+    # each file is read on first access and again whenever it changes on disk
+    STATS = LazyFile('./db/stats.json')
+    BENCHMARKS = LazyFile('./db/benchmark_stats.json')
+    DETAILS = LazyFile('./db/player_details.json')
+    DEPTH_CHART = LazyFile('./db/depth_chart.json')
+    SCHEDULE = LazyFile('./db/schedule.json')
+    FILTERED_STATS = LazyFile('./db/filtered_stats.json')
+    PROCESSED_STATS = LazyFile('./db/processed_stats.json')
+    RESULTS = LazyFile('./db/results.json')
+    TIMESTAMPS = LazyFile('./db/timestamps.json')
+    INJURIES = LazyFile('./db/injuries.json')
 
 
 @dataclass
@@ -1,35 +1,556 @@
 #!/usr/bin/env python3
 
-from bs4 import BeautifulSoup
-from requests import get
-from json import dump, load
+from bs4 import BeautifulSoup, SoupStrainer
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from hashlib import sha256
+from lib.http_cache import ResponseCache
+from lib.metrics import FetchMetrics
+from lib.rate_limit import RateLimiter, retry_after
+from lib.replay import FixtureArchive, standin_url
+from lib.sqlite_store import SQLiteStore
+from json import dumps, load, loads
+from typing import Callable, Dict, Hashable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import marshal
+import os
+import random
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # advisory locks are posix only, writes are still atomic without them
+    fcntl = None
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Defaults for the shared client, override with configure()
+TIMEOUT = (5, 30)  # (connect, read) in seconds
+RETRIES = 3
+BACKOFF = 0.5  # base delay in seconds, doubled on every retry
+POOL_SIZE = 32
+WORKERS = 16
+PAGE_SIZE = 1000  # items per page when reading ESPN collections
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SNAPSHOTS = True  # keep a {file}.marshal sidecar next to every json written
+DIGESTS = True  # keep a {file}.sha256 sidecar next to every json written
+
+
+class Client:
+    """A session-backed HTTP client that keeps connections to each host
+    alive between requests and retries transient failures with a jittered
+    exponential backoff. Responses are served from and saved to an optional
+    ResponseCache (see lib.http_cache).
+
+    With an archive (see lib.replay), mode 'record' saves every response
+    to it and mode 'replay' answers from it without touching the network.
+    standin sends every request to a lib.replay.StandIn server instead of
+    the real host. A limiter (see lib.rate_limit) paces every request
+    sent, retries included.
+    """
+
+    def __init__(self, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE,
+                 cache=None, archive=None, mode=None, standin=None, limiter=None):
+        if mode not in (None, 'record', 'replay'):
+            raise ValueError(f"Unknown client mode {mode}")
+        if mode and archive is None:
+            raise ValueError(f"Client mode {mode} needs a fixture archive")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.archive = archive
+        self.mode = mode
+        self.standin = standin
+        self.limiter = limiter
+        self.metrics = FetchMetrics()
+        self.requests = 0  # every get()
+        self.sent = 0  # the ones that went over the network, retries included
+        self.failed = 0  # the ones still failing once retries ran out
+        self._count_lock = threading.Lock()
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _sleep(self, attempt: int, wait: float = None) -> None:
+        # "full jitter" so parallel callers don't retry in lock step, but
+        # never sooner than the server asked for
+        time.sleep(max(random.uniform(0, self.backoff * 2 ** attempt), wait or 0))
+
+    def _send(self, url: str, headers: Dict) -> Response:
+        target = standin_url(self.standin, url) if self.standin else url
+        attempt = 0
+        while True:
+            with self._count_lock:
+                self.sent += 1
+            if self.limiter:
+                self.limiter.acquire()
+            response, wait = None, None
+            start = time.perf_counter()
+            try:
+                response = self.session.get(
+                    target, headers=headers, timeout=self.timeout)
+                wait = retry_after(response)
+            except RequestException:
+                if attempt >= self.retries:
+                    self._failed()
+                    raise
+            finally:
+                status = response.status_code if response is not None else None
+                self.metrics.sent(url, attempt, time.perf_counter() - start, status,
+                                  len(response.content) if response is not None else 0)
+                if self.limiter:
+                    self.limiter.release(status, wait)
+            if response is not None:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if attempt >= self.retries:
+                    self._failed()
+                    return response
+            self._sleep(attempt, wait)
+            attempt += 1
+
+    def _failed(self) -> None:
+        with self._count_lock:
+            self.failed += 1
+
+    def get(self, url: str) -> Response:
+        """Sends a single GET request, retrying connection errors and
+        retryable status codes up to the configured amount of times. Fresh
+        cached responses are returned without a request and stale ones are
+        revalidated.
+
+        Args:
+            url (str): the url to request
+
+        Raises:
+            RequestException: the last connection error once retries run out
+
+        Returns:
+            Response: the final response, which may still be an error status
+        """
+        with self._count_lock:
+            self.requests += 1
+        self.metrics.request(url)
+        if self.mode == 'replay':
+            return self.archive.response(url)
+        response = self._get(url)
+        if self.mode == 'record':
+            self.archive.save(url, response)
+        return response
+
+    def _get(self, url: str) -> Response:
+        if not self.cache:
+            return self._send(url, {})
+
+        entry = self.cache.lookup(url)
+        if entry and entry['fresh']:
+            cached = self.cache.response(entry)
+            if cached is not None:
+                self.cache.count('hits')
+                return cached
+            # evicted since the lookup, a miss after all
+            entry = None
+
+        response = self._send(
+            url, self.cache.validators(entry) if entry else {})
+        if entry and response.status_code == 304:
+            self.cache.refresh(entry)
+            cached = self.cache.response(entry)
+            if cached is not None:
+                self.cache.count('revalidations')
+                return cached
+            # the 304 has no body to stand in for the evicted one
+            response = self._send(url, {})
+        self.cache.count('misses')
+        self.cache.store(url, response)
+        return response
+
+    def report(self) -> str:
+        """Summarizes the client's activity for the end of a run
+        """
+        lines = [f'{self.requests} requests, {self.sent} sent over the network, '
+                 f'{self.failed} failed after retries',
+                 self.cache.report() if self.cache else 'HTTP cache disabled']
+        if self.limiter:
+            lines.append(self.limiter.report())
+        lines.append(self.metrics.report())
+        if self.mode == 'replay':
+            lines.append(
+                f'Replay: {self.archive.missing} urls missing from {self.archive.directory}')
+        return '\n'.join(lines)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def shared_client() -> Client:
+    """Returns the client shared by every GetData call, creating it on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client()
+        return _client
+
+
+def configure(**kwargs) -> Client:
+    """Replaces the shared client with one built from the keyword arguments
+    accepted by Client (timeout, retries, backoff, pool_size, cache, archive,
+    mode, standin, limiter)
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = Client(**kwargs)
+        return _client
+
+
+def configure_from(settings) -> Client:
+    """Replaces the shared client with one built from lib.constants.Settings
+    """
+    cache = None
+    if settings.HTTP_CACHE:
+        cache = ResponseCache(settings.HTTP_CACHE,
+                              settings.HTTP_CACHE_MB * 2**20)
+    archive = FixtureArchive(settings.FIXTURES) if settings.HTTP_MODE else None
+    limiter = None
+    if settings.RATE_LIMIT:
+        limiter = RateLimiter(settings.RATE_LIMIT, concurrency=settings.WORKERS)
+    return configure(cache=cache, archive=archive, mode=settings.HTTP_MODE,
+                     standin=settings.STANDIN, limiter=limiter)
 
 
 class GetData:
-    def __init__(self, url):
+    def __init__(self, url, client=None):
         self.url = url
+        self.client = client
 
-    def scrape(self):
-        result = get(self.url).text
-        return BeautifulSoup(result, 'html.parser')
+    def _get(self) -> Response:
+        return (self.client or shared_client()).get(self.url)
+
+    def scrape(self, parse_only: SoupStrainer = None):
+        """Parses the page, only the tags parse_only keeps when given, with
+        lxml when it's installed
+        """
+        result = self._get().text
+        if parse_only is None:
+            return BeautifulSoup(result, 'html.parser')
+        return BeautifulSoup(result, HTML_PARSER, parse_only=parse_only)
 
     def query(self):
-        request = get(self.url)
+        request = self._get()
         if request.status_code == 200:
-            return get(self.url).json()
+            return request.json()
         else:
             return {}
 
 
+def query_all(urls: Dict[Hashable, str], workers: int = WORKERS,
+              progress: Callable[[int, int], None] = None,
+              checkpoint: Callable[[Hashable, Dict], None] = None,
+              priority: Dict[Hashable, int] = None) -> Dict[Hashable, Dict]:
+    """Queries every url on a bounded pool of threads sharing the same
+    client connections
+
+    Args:
+        urls (Dict): key -> url to query, e.g. ESPN ID -> stats url
+        workers (int): the most requests allowed in flight at once
+        progress (Callable): called with (completed, total) after every response
+        checkpoint (Callable): called with (key, body) as each successful
+        response arrives, e.g. to journal it (see lib.journal)
+        priority (Dict): key -> rank, lower ranks are requested first and
+        keys without one go last, so a run cut short has the ones that
+        matter most
+
+    Returns:
+        Dict: key -> the json body (or {} like GetData.query, also when the
+        request still fails once its retries run out), in the same key order
+        as urls regardless of the order responses arrive in
+    """
+    def query(url):
+        try:
+            return GetData(url).query()
+        except RequestException:
+            # the client has already counted it as failed in its metrics
+            return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        order = list(urls)
+        if priority:
+            order.sort(key=lambda key: priority.get(key, float('inf')))
+        # the pool starts queued requests in the order they're submitted
+        futures = {executor.submit(query, urls[key]): key for key in order}
+        try:
+            for completed, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if checkpoint and results[futures[future]]:
+                    checkpoint(futures[future], results[futures[future]])
+                if progress:
+                    progress(completed, len(futures))
+        except BaseException:
+            # don't sit through every queued request before raising
+            executor.shutdown(cancel_futures=True)
+            raise
+    return {key: results[key] for key in urls}
+
+
+def page_url(url: str, page: int, limit: int = PAGE_SIZE) -> str:
+    """Adds ESPN's collection paging parameters to a url, keeping its query
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({'limit': limit, 'page': page})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def query_pages(urls: Dict[Hashable, str], limit: int = PAGE_SIZE,
+                workers: int = WORKERS) -> Dict[Hashable, Dict]:
+    """Reads every page of some ESPN collections (bodies with count,
+    pageIndex, pageCount and items). Every first page is queried at once,
+    then every remaining page they report.
+
+    Args:
+        urls (Dict): key -> collection url
+        limit (int): items per page
+        workers (int): the most requests allowed in flight at once
+
+    Returns:
+        Dict: key -> the first page with every later page's items appended
+        to its items, or {} like GetData.query when the first page fails
+    """
+    collections = query_all({key: page_url(url, 1, limit)
+                             for key, url in urls.items()}, workers)
+    pages = query_all({(key, page): page_url(urls[key], page, limit)
+                       for key, first in collections.items() if first
+                       for page in range(2, first.get('pageCount', 1) + 1)}, workers)
+    for (key, page), body in pages.items():
+        collections[key]['items'].extend(body.get('items', []))
+    return collections
+
+
+_store = None
+
+
+def use_sqlite(path: str, root: str = './db') -> SQLiteStore:
+    """Sends every ReadWrite of a file under root to a SQLite database
+    instead of the json files (see lib.sqlite_store)
+    """
+    global _store
+    _store = SQLiteStore(path, root)
+    return _store
+
+
+def sqlite_store() -> SQLiteStore:
+    """Returns the SQLite store in use, or None for the json db
+    """
+    return _store
+
+
 class ReadWrite:
+    """Reads and writes the json files in the db. Every write also leaves a
+    marshal snapshot of the data next to the json ({file}.marshal), stamped
+    with the json's size and modification time. Reads load the snapshot,
+    which is several times faster to parse, as long as the stamp still
+    matches the json and fall back to the json otherwise.
+
+    Writes go to a temporary file that is fsynced and then renamed over the
+    destination, so a crash or a concurrent reader never sees a partial file.
+    Writers hold an exclusive advisory lock on {file}.lock and readers a
+    shared one. The sha256 of every write is kept in {file}.sha256 so later
+    stages can tell when nothing changed (see digest()).
+
+    After use_sqlite(), files under the db are kept in SQLite instead.
+    """
+
     def __init__(self, destination, file=None):
         self.destination = destination
         self.file = file
+        self.snapshot = f'{destination}.marshal'
+        self.lock = f'{destination}.lock'
+        self.digest_path = f'{destination}.sha256'
+        self.store = _store if _store is not None and _store.holds(
+            destination) else None
+
+    @contextmanager
+    def _locked(self, shared: bool):
+        # readers only lock files that have been written, which leaves mocks untouched
+        if fcntl is None or (shared and not os.path.exists(self.lock)):
+            yield
+            return
+        with open(self.lock, 'a') as lf:
+            fcntl.flock(lf, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _stamp(self) -> bytes:
+        stat = os.stat(self.destination)
+        return struct.pack('<qq', stat.st_size, stat.st_mtime_ns)
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot, 'rb') as sf:
+                if sf.read(16) != self._stamp():
+                    return None
+                # loads() on the whole buffer, load() on a file reads it piecemeal
+                return (marshal.loads(sf.read()),)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _write_snapshot(self, data) -> None:
+        tmp = f'{self.snapshot}.{os.getpid()}.{threading.get_ident()}'
+        try:
+            with open(tmp, 'wb') as sf:
+                sf.write(self._stamp())
+                sf.write(marshal.dumps(data))
+            os.replace(tmp, self.snapshot)
+        except OSError:
+            # the json alone will do
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _write_digest(self, digest: str) -> None:
+        tmp = f'{self.digest_path}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp, 'w') as df:
+            df.write(f'{self._stamp().hex()} {digest}')
+        os.replace(tmp, self.digest_path)
+
+    def digest(self) -> str:
+        """Returns the sha256 of the json, taken from its .sha256 sidecar when
+        that still matches the file
+
+        Returns:
+            str: the hex digest of the file's contents
+        """
+        if self.store:
+            return self.store.digest(self.destination)
+        try:
+            with open(self.digest_path) as df:
+                stamp, digest = df.read().split()
+            if bytes.fromhex(stamp) == self._stamp():
+                return digest
+        except (OSError, ValueError):
+            pass
+        with self._locked(shared=True):
+            with open(self.destination, 'rb') as jf:
+                return sha256(jf.read()).hexdigest()
+
+    def version(self):
+        """Returns a value that changes every time the file is written
+        """
+        if self.store:
+            return self.store.version(self.destination)
+        stat = os.stat(self.destination)
+        return (stat.st_mtime_ns, stat.st_size)
 
     def read(self):
-        with open(self.destination) as jf:
-            return load(jf)
+        if self.store:
+            return self.store.read(self.destination)
+        with self._locked(shared=True):
+            if SNAPSHOTS:
+                snapshot = self._read_snapshot()
+                if snapshot:
+                    return snapshot[0]
+            with open(self.destination) as jf:
+                data = load(jf)
+            # only refresh snapshots that exist so reading mocks leaves no trace
+            if SNAPSHOTS and os.path.exists(self.snapshot):
+                self._write_snapshot(data)
+            return data
+
+    def write(self) -> str:
+        """Atomically replaces the destination with the json of self.file
+
+        Returns:
+            str: the sha256 of what was written
+        """
+        if self.store:
+            return self.store.write(self.destination, self.file)
+        text = dumps(self.file, ensure_ascii=False)
+        content = text.encode('utf8')
+        digest = sha256(content).hexdigest()
+        tmp = f'{self.destination}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with self._locked(shared=False):
+            try:
+                with open(tmp, 'wb') as jf:
+                    jf.write(content)
+                    jf.flush()
+                    os.fsync(jf.fileno())
+                os.replace(tmp, self.destination)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            _fsync_directory(self.destination)
+            if SNAPSHOTS:
+                # snapshot what a json read returns (str keys, lists, floats)
+                self._write_snapshot(loads(text))
+            if DIGESTS:
+                self._write_digest(digest)
+        return digest
+
+
+def _fsync_directory(path: str) -> None:
+    # makes the rename itself durable, not possible on every platform
+    try:
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class LazyFile:
+    """A class attribute that reads its json file on first access, hands back
+    the same object on later accesses, and reads it again whenever the file's
+    modification time or size changes on disk (or its version in SQLite)
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self._data = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def __get__(self, obj, owner=None):
+        with self._lock:
+            # stamped under the lock so a save() can't land in between
+            stamp = ReadWrite(self.destination).version()
+            if stamp != self._stamp:
+                self._data = ReadWrite(self.destination).read()
+                self._stamp = stamp
+            return self._data
 
-    def write(self):
-        with open(self.destination, 'w', encoding='utf8') as jf:
-            dump(self.file, jf, ensure_ascii=False)
+    def save(self) -> None:
+        """Writes the object handed out back to its file, from a copy so
+        other threads can keep changing it, without reading it back in
+        """
+        with self._lock:
+            if self._data is None:
+                return
+            data = self._data.copy()
+            ReadWrite(self.destination, data).write()
+            self._stamp = ReadWrite(self.destination).version()
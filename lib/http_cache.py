@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+from hashlib import sha1
+from json import dump, load
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from typing import Dict, List, Tuple
+import os
+import threading
+import time
+
+# (url fragment, seconds a response stays fresh), first match wins
+TTLS = [
+    ('scoreboard', 10 * 60),
+    ('/injuries/', 60 * 60),
+    ('/depthcharts', 6 * 60 * 60),
+    ('/statistics/', 6 * 60 * 60),
+    ('/athletes/', 12 * 60 * 60),
+    ('cbssports.com', 24 * 60 * 60),
+]
+DEFAULT_TTL = 60 * 60
+MAX_BYTES = 512 * 2**20
+
+
+class ResponseCache:
+    """A size-bounded, least recently used cache of successful responses
+    stored on disk and keyed by url. Each entry is a pair of files:
+    {key}.body with the raw content and {key}.json with the url, validators
+    and time it was stored. Stale entries carrying an ETag or Last-Modified
+    header are revalidated with a conditional request instead of refetched.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES, ttls: List[Tuple[str, int]] = None,
+                 default_ttl: int = DEFAULT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.stats = {'hits': 0, 'misses': 0, 'revalidations': 0}
+        self._lock = threading.Lock()
+        self._index = None  # key -> [size, last access]
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, url: str) -> str:
+        return sha1(url.encode('utf8')).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def _load_index(self) -> Dict:
+        # built once per process by scanning the entries already on disk
+        if self._index is None:
+            self._index = {}
+            for name in os.listdir(self.directory):
+                if name.endswith('.body'):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    self._index[name[:-5]] = [stat.st_size, stat.st_mtime]
+        return self._index
+
+    def ttl(self, url: str) -> int:
+        for fragment, seconds in self.ttls:
+            if fragment in url:
+                return seconds
+        return self.default_ttl
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def lookup(self, url: str) -> Dict:
+        """Finds the stored metadata for a url
+
+        Returns:
+            Dict: the entry's url, headers, stored time and whether it is still
+            fresh, or None if the url isn't cached
+        """
+        key = self._key(url)
+        with self._lock:
+            if key not in self._load_index():
+                return None
+        try:
+            with open(self._path(key, 'json')) as jf:
+                entry = load(jf)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        entry['key'] = key
+        entry['fresh'] = time.time() - entry['stored'] < self.ttl(url)
+        return entry
+
+    def validators(self, entry: Dict) -> Dict:
+        """Builds the conditional request headers for a stale entry
+        """
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def response(self, entry: Dict) -> Response:
+        """Rebuilds a response from a cached entry and marks it as recently used
+
+        Returns:
+            Response: the cached response, None if another thread evicted or
+            replaced the entry since it was looked up
+        """
+        path = self._path(entry['key'], 'body')
+        now = time.time()
+        try:
+            with open(path, 'rb') as body:
+                content = body.read()
+            os.utime(path, (now, now))
+        except OSError:
+            return None
+        with self._lock:
+            self._load_index()[entry['key']] = [len(content), now]
+        response = Response()
+        response.status_code = 200
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = content
+        response.encoding = entry.get('encoding')
+        return response
+
+    def refresh(self, entry: Dict) -> None:
+        """Restarts the time to live of an entry confirmed by a 304 response
+        """
+        entry['stored'] = time.time()
+        self._write_meta(entry['key'], entry)
+
+    def store(self, url: str, response: Response) -> None:
+        """Saves a successful response and evicts the least recently used
+        entries while the cache is over its size limit
+        """
+        if response.status_code != 200:
+            return
+        key = self._key(url)
+        headers = {name: response.headers[name] for name in ('Content-Type', 'ETag', 'Last-Modified')
+                   if response.headers.get(name)}
+        tmp = self._path(key, f'body.{threading.get_ident()}')
+        with open(tmp, 'wb') as body:
+            body.write(response.content)
+        os.replace(tmp, self._path(key, 'body'))
+        self._write_meta(key, {'url': url, 'headers': headers, 'stored': time.time(),
+                               'encoding': response.encoding})
+        with self._lock:
+            self._load_index()[key] = [len(response.content), time.time()]
+            self._evict()
+
+    def _write_meta(self, key: str, entry: Dict) -> None:
+        meta = {name: entry[name]
+                for name in ('url', 'headers', 'stored', 'encoding') if name in entry}
+        tmp = self._path(key, f'json.{threading.get_ident()}')
+        with open(tmp, 'w', encoding='utf8') as jf:
+            dump(meta, jf)
+        os.replace(tmp, self._path(key, 'json'))
+
+    def _evict(self) -> None:
+        index = self._index
+        total = sum(size for size, _ in index.values())
+        for key in sorted(index, key=lambda key: index[key][1]):
+            if total <= self.max_bytes:
+                break
+            total -= index.pop(key)[0]
+            for ext in ('body', 'json'):
+                try:
+                    os.remove(self._path(key, ext))
+                except FileNotFoundError:
+                    pass
+
+    def report(self) -> str:
+        return (f"HTTP cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['revalidations']} revalidated")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+from json import dumps, loads
+from typing import Dict, Hashable
+import os
+import threading
+
+
+class Journal:
+    """An append-only record of the work a run has finished, so a run that
+    dies part way can pick up where it stopped. Each line is one json
+    object: a unit of work a stage completed ({"stage", "key", "value"})
+    or a stage finishing ({"stage", "finished": true}). Lines are flushed
+    as they're written and the file is synced when a stage finishes. A
+    line torn by a crash is ignored on the next read.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): the journal file, e.g. ./db/journal/update_2022_week_11.jsonl
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._units = {}
+        self._finished = set()
+        self._file = None
+        try:
+            with open(path, encoding='utf8') as jf:
+                for line in jf:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('finished'):
+                        self._finished.add(entry['stage'])
+                    else:
+                        self._units.setdefault(entry['stage'], {})[
+                            entry['key']] = entry['value']
+        except FileNotFoundError:
+            pass
+
+    @property
+    def resumed(self) -> bool:
+        """Whether an earlier run left anything in the journal
+        """
+        return bool(self._units or self._finished)
+
+    def _append(self, entry: Dict) -> None:
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                torn = False
+                if os.path.exists(self.path) and os.path.getsize(self.path):
+                    with open(self.path, 'rb') as jf:
+                        jf.seek(-1, os.SEEK_END)
+                        torn = jf.read(1) != b'\n'
+                self._file = open(self.path, 'a', encoding='utf8')
+                # start past a line torn by a crash instead of continuing it
+                if torn:
+                    self._file.write('\n')
+            self._file.write(dumps(entry) + '\n')
+            self._file.flush()
+
+    def done(self, stage: str) -> Dict:
+        """Returns key -> value for every unit of a stage already finished
+        """
+        return dict(self._units.get(stage, {}))
+
+    def record(self, stage: str, key: Hashable, value) -> None:
+        """Checkpoints one finished unit of work, e.g. an athlete's stats
+        """
+        self._units.setdefault(stage, {})[key] = value
+        self._append({'stage': stage, 'key': key, 'value': value})
+
+    def finish(self, stage: str) -> None:
+        self._finished.add(stage)
+        self._append({'stage': stage, 'finished': True})
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def finished(self, stage: str) -> bool:
+        return stage in self._finished
+
+    def clear(self) -> None:
+        """Removes the journal once the whole run has finished
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self._units = {}
+        self._finished = set()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+from json import dump
+from typing import Dict, Iterable, List
+from urllib.parse import urlsplit
+import datetime
+import os
+import re
+import threading
+
+DIRECTORY = './db/metrics'
+PERCENTILES = (50, 90, 99)
+_ID = re.compile(r'^\d+$')
+
+
+def endpoint(url: str) -> str:
+    """Groups urls by endpoint: the host and path with every numeric
+    segment replaced, e.g. .../athletes/4262197/statistics/0 ->
+    .../athletes/{id}/statistics/{id}
+    """
+    parts = urlsplit(url)
+    path = '/'.join('{id}' if _ID.match(segment) else segment
+                    for segment in parts.path.split('/'))
+    return f'{parts.netloc}{path}'
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest rank percentile of already sorted values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+class FetchMetrics:
+    """Counts what the fetch layer did, per endpoint: requests made,
+    requests sent over the network and their latencies, bytes downloaded,
+    retries, connection errors and every status other than 200. Stages
+    can also note which keys came back empty, e.g. athletes without stats.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.empty = {}
+        self.started = datetime.datetime.now()
+
+    def _endpoint(self, url: str) -> Dict:
+        name = endpoint(url)
+        if name not in self.endpoints:
+            self.endpoints[name] = {'requests': 0, 'sent': 0, 'retries': 0, 'errors': 0,
+                                    'bytes': 0, 'statuses': {}, 'latencies': []}
+        return self.endpoints[name]
+
+    def request(self, url: str) -> None:
+        with self._lock:
+            self._endpoint(url)['requests'] += 1
+
+    def sent(self, url: str, attempt: int, seconds: float, status: int = None,
+             size: int = 0) -> None:
+        """Records one trip over the network
+
+        Args:
+            url (str): the url requested
+            attempt (int): 0 for the first try, then 1, 2... for retries
+            seconds (float): how long the response took
+            status (int): the response's status, None if the connection failed
+            size (int): bytes downloaded
+        """
+        with self._lock:
+            stats = self._endpoint(url)
+            stats['sent'] += 1
+            stats['retries'] += attempt > 0
+            stats['latencies'].append(seconds)
+            stats['bytes'] += size
+            if status is None:
+                stats['errors'] += 1
+            elif status != 200:
+                stats['statuses'][str(status)] = stats['statuses'].get(
+                    str(status), 0) + 1
+
+    def record_empty(self, label: str, keys: Iterable) -> None:
+        """Notes keys of a batch that came back without data
+        """
+        with self._lock:
+            self.empty.setdefault(label, []).extend(keys)
+
+    def summary(self) -> Dict:
+        """Returns the metrics with latencies reduced to percentiles, in seconds
+        """
+        with self._lock:
+            endpoints = {}
+            for name, stats in self.endpoints.items():
+                latencies = sorted(stats['latencies'])
+                endpoints[name] = {key: value for key, value in stats.items()
+                                   if key != 'latencies'}
+                endpoints[name]['latency'] = {
+                    f'p{q}': percentile(latencies, q) for q in PERCENTILES}
+                endpoints[name]['latency']['total'] = sum(latencies)
+            return {'started': str(self.started), 'finished': str(datetime.datetime.now()),
+                    'endpoints': endpoints,
+                    'empty': {label: list(keys) for label, keys in self.empty.items()}}
+
+    def report(self) -> str:
+        """Summarizes each endpoint in a line, slowest in total first
+        """
+        summary = self.summary()
+        lines = []
+        for name, stats in sorted(summary['endpoints'].items(),
+                                  key=lambda item: -item[1]['latency']['total']):
+            latency = stats['latency']
+            timing = ('' if latency['p50'] is None else
+                      f" p50 {latency['p50'] * 1000:.0f}ms p90 {latency['p90'] * 1000:.0f}ms"
+                      f" p99 {latency['p99'] * 1000:.0f}ms")
+            lines.append(f"{name}: {stats['requests']} requests, {stats['sent']} sent,"
+                         f" {stats['retries']} retries, {stats['errors']} errors,"
+                         f" {stats['bytes'] / 2**20:.1f}MB{timing}"
+                         + (f", statuses {stats['statuses']}" if stats['statuses'] else ''))
+        for label, keys in summary['empty'].items():
+            lines.append(f"{len(keys)} empty {label}")
+        return '\n'.join(lines)
+
+    def save(self, name: str, directory: str = DIRECTORY) -> str:
+        """Writes the summary to {directory}/{name}_{time}.json
+
+        Returns:
+            str: the file written
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, f"{name}_{self.started.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w', encoding='utf8') as jf:
+            dump(self.summary(), jf, indent=1)
+        return path
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+from email.utils import parsedate_to_datetime
+from requests import Response
+import datetime
+import threading
+import time
+
+RATE = 25.0  # requests per second on average
+BURST = 50  # requests allowed at once after a quiet spell
+CONCURRENCY = 16  # the most requests in flight once the limiter trusts the host
+MIN_CONCURRENCY = 1
+MAX_RETRY_AFTER = 120  # never pause longer than this on a server's say so
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after(response: Response) -> float:
+    """Reads a response's Retry-After header, given either in seconds or as
+    an HTTP date
+
+    Returns:
+        float: seconds to wait, None without a usable header
+    """
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = (date - datetime.datetime.now(date.tzinfo)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class RateLimiter:
+    """Paces requests with a token bucket (rate per second, up to burst at
+    once) and caps how many are in flight with a window that adapts the
+    way TCP's does: every good response widens it by 1/window, every
+    throttled one (429, 5xx or a dropped connection) halves it. A
+    Retry-After header pauses every request until it passes.
+    """
+
+    def __init__(self, rate: float = RATE, burst: int = BURST, concurrency: int = CONCURRENCY,
+                 min_concurrency: int = MIN_CONCURRENCY):
+        """
+        Args:
+            rate (float): requests per second, None to only limit concurrency
+            burst (int): the most requests sent back to back
+            concurrency (int): the widest the in flight window gets
+            min_concurrency (int): the narrowest the window gets
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.window = float(concurrency)
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {'throttled': 0, 'paused': 0.0}
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    self._condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.window):
+                    self._condition.wait()
+                elif self.rate and self.tokens < 1:
+                    self._condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    if self.rate:
+                        self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+    def release(self, status: int = None, wait: float = None) -> None:
+        """Ends a request and adjusts the window to how it went
+
+        Args:
+            status (int): the response's status, None if the connection failed
+            wait (float): seconds the server asked for in Retry-After
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status is None or status in THROTTLE_STATUSES:
+                self.stats['throttled'] += 1
+                self.window = max(self.min_concurrency, self.window / 2)
+            else:
+                self.window = min(self.max_concurrency,
+                                  self.window + 1 / self.window)
+            if wait:
+                until = time.monotonic() + wait
+                if until > self.paused_until:
+                    self.stats['paused'] += until - max(self.paused_until, time.monotonic())
+                    self.paused_until = until
+            self._condition.notify_all()
+
+    def report(self) -> str:
+        return (f"Rate limit: {self.stats['throttled']} throttled responses, "
+                f"paused {self.stats['paused']:.1f}s, window {self.window:.1f}")
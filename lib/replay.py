@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dump, load
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+from typing import Dict
+import argparse
+import os
+import random
+import socket
+import threading
+import time
+
+
+class FixtureArchive:
+    """A directory of recorded responses keyed by url. Each response is a
+    pair of files: {key}.body with the raw content and {key}.json with the
+    url, status and content type. Used by the client's record and replay
+    modes and served over HTTP by StandIn.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.missing = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{sha1(url.encode('utf8')).hexdigest()}.{ext}")
+
+    def save(self, url: str, response: Response) -> None:
+        meta = {'url': url, 'status': response.status_code,
+                'content_type': response.headers.get('Content-Type'),
+                'encoding': response.encoding}
+        suffix = threading.get_ident()
+        with open(self._path(url, f'body.{suffix}'), 'wb') as body:
+            body.write(response.content)
+        os.replace(self._path(url, f'body.{suffix}'), self._path(url, 'body'))
+        with open(self._path(url, f'json.{suffix}'), 'w', encoding='utf8') as jf:
+            dump(meta, jf)
+        os.replace(self._path(url, f'json.{suffix}'), self._path(url, 'json'))
+
+    def fixture(self, url: str) -> Dict:
+        """Returns the recorded status, content type and body of a url,
+        or None when it was never recorded
+        """
+        try:
+            with open(self._path(url, 'json')) as jf:
+                meta = load(jf)
+            with open(self._path(url, 'body'), 'rb') as body:
+                meta['body'] = body.read()
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('url') == url else None
+
+    def response(self, url: str) -> Response:
+        """Replays a recorded url, unrecorded urls come back as a 404
+        """
+        fixture = self.fixture(url)
+        response = Response()
+        response.url = url
+        if fixture is None:
+            # replayed from every query_all thread at once
+            with self._lock:
+                self.missing += 1
+            response.status_code = 404
+            response._content = b''
+            return response
+        response.status_code = fixture['status']
+        response.headers = CaseInsensitiveDict(
+            {'Content-Type': fixture['content_type'] or 'application/json'})
+        response._content = fixture['body']
+        response.encoding = fixture.get('encoding')
+        return response
+
+
+def standin_url(base: str, url: str) -> str:
+    """Rewrites a real url so it's requested from a StandIn server instead,
+    e.g. https://host/path?q -> http://127.0.0.1:8000/host/path?q
+    """
+    parts = urlsplit(url)
+    query = f'?{parts.query}' if parts.query else ''
+    return f"{base.rstrip('/')}/{parts.netloc}{parts.path}{query}"
+
+
+class StandIn(ThreadingHTTPServer):
+    """A local HTTP server answering for ESPN and CBS from a FixtureArchive.
+    Requests are made to /{host}/{path} (see standin_url). Every response
+    waits latency seconds plus up to jitter seconds, and error_rate of them
+    fail with error_status so retries and throttling can be exercised.
+    """
+    daemon_threads = True
+
+    def __init__(self, archive: FixtureArchive, port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        super().__init__(('127.0.0.1', port), _StandInHandler)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self) -> 'StandIn':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as separate writes, don't let Nagle hold the body
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+        path = self.path.lstrip('/')
+        fixture = server.archive.fixture(
+            f'https://{path}') or server.archive.fixture(f'http://{path}')
+        if random.random() < server.error_rate:
+            status, body, content_type = server.error_status, b'', 'text/plain'
+        elif fixture is None:
+            status, body, content_type = 404, b'', 'text/plain'
+        else:
+            status, body = fixture['status'], fixture['body']
+            content_type = fixture['content_type'] or 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    """To Run: python3 -m lib.replay --archive ./db/fixtures --port 8000
+        Then set Settings.STANDIN = 'http://127.0.0.1:8000' so the update
+        and process modules fetch from it
+    """
+    parser = argparse.ArgumentParser(
+        description='Serve a recorded fixture archive in place of ESPN and CBS')
+    parser.add_argument('--archive', default='./db/fixtures')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='up to this many extra seconds per response')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of responses that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+    server = StandIn(FixtureArchive(args.archive), args.port, args.latency, args.jitter,
+                     args.error_rate, args.error_status)
+    print(f'Serving {args.archive} at {server.url}')
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
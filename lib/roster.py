@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+from lib.constants import Files, Lists
+from lib.db_utils import ReadWrite
+from typing import Dict, List, NamedTuple
+
+
+class Slot(NamedTuple):
+    team: str
+    position: str
+    depth: str
+    id: str
+    status: str  # from the player details, None when the athlete has none
+    data: Dict  # the athlete's entry in the depth chart
+
+
+class RosterIndex:
+    """Every depth chart slot in the league indexed by team, position, depth,
+    position group and ESPN ID, so the process stages look athletes up
+    directly instead of walking depth_chart[team][position][depth]. Slots
+    keep the depth chart's order wherever a list of them is returned.
+    """
+
+    GROUPS = {
+        'offensive line': Lists.offensive_line,
+        'offense': Lists.offense_positions,
+        'secondary': Lists.secondary_positions,
+        'defense': Lists.defense_positions,
+    }
+
+    _cache = None
+
+    def __init__(self, depth_chart: Dict, details: Dict = None):
+        """
+        Args:
+            depth_chart (Dict): team -> position -> depth -> athlete, like
+            db/depth_chart.json
+            details (Dict, optional): ESPN ID -> details, like
+            db/player_details.json, where each slot's status comes from
+        """
+        details = details or {}
+        membership = {position: group for group, positions in self.GROUPS.items()
+                      for position in positions}
+        self.slots = []
+        self._teams = {}
+        self._positions = {}
+        self._groups = {}
+        self._players = {}
+        for team in depth_chart:
+            self._teams[team] = []
+            for position in depth_chart[team]:
+                self._positions[(team, position)] = {}
+                for depth, data in depth_chart[team][position].items():
+                    id = data.get('id')
+                    slot = Slot(team, position, depth, id,
+                                details[id].get('status') if details.get(id) else None, data)
+                    self.slots.append(slot)
+                    self._teams[team].append(slot)
+                    self._positions[(team, position)][depth] = slot
+                    self._players.setdefault(id, slot)
+                    if position in membership:
+                        self._groups.setdefault(
+                            (team, membership[position]), []).append(slot)
+
+    @classmethod
+    def load(cls) -> 'RosterIndex':
+        """Builds the index from db/depth_chart.json and db/player_details.json,
+        reusing the last one built until either file changes
+
+        Returns:
+            RosterIndex: the league's current rosters
+        """
+        versions = (ReadWrite('./db/depth_chart.json').version(),
+                    ReadWrite('./db/player_details.json').version())
+        if cls._cache is None or cls._cache[0] != versions:
+            cls._cache = (versions, cls(Files.DEPTH_CHART, Files.DETAILS))
+        return cls._cache[1]
+
+    @property
+    def teams(self) -> List[str]:
+        return list(self._teams)
+
+    def team(self, team: str) -> List[Slot]:
+        return self._teams.get(team, [])
+
+    def position(self, team: str, position: str) -> Dict[str, Slot]:
+        """Returns depth -> slot for one position on a team
+        """
+        return self._positions.get((team, position), {})
+
+    def group(self, team: str, group: str) -> List[Slot]:
+        """Returns a team's slots in one of the GROUPS, e.g. 'offensive line'
+        """
+        return self._groups.get((team, group), [])
+
+    def starter(self, team: str, position: str = 'quarterback') -> Slot:
+        """Returns the first string athlete at a position, None if it's empty
+        """
+        return self.position(team, position).get("1")
+
+    def player(self, id: str) -> Slot:
+        """Returns the first slot an athlete is listed in, None if unlisted
+        """
+        return self._players.get(id)
+
+    def active(self, team: str, statuses: List[str] = ('healthy', 'questionable')) -> List[Slot]:
+        """Returns a team's slots whose athlete has one of the given statuses
+        """
+        return [slot for slot in self.team(team) if slot.status in statuses]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from lib.constants import Files
+from lib.db_utils import ReadWrite
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import argparse
+import datetime
+import time
+
+TIMINGS = './db/timings.json'
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[], None]
+    inputs: Tuple[str, ...]  # the db files the stage reads, e.g. 'results.json'
+    outputs: Tuple[str, ...]  # the db files the stage writes
+
+
+def save_timestamps() -> None:
+    """Writes db/timestamps.json while other stages may still be setting
+    their own timestamps
+    """
+    vars(Files)['TIMESTAMPS'].save()
+
+
+class Scheduler:
+    """Runs a pipeline's stages on a pool of threads, each one as soon as
+    the stages it depends on have finished. A stage depends on every stage
+    listed before it that writes a file it reads, reads a file it writes
+    or writes a file it also writes, so stages that share nothing run at
+    the same time and everything else keeps the listed order.
+    """
+
+    def __init__(self, name: str, stages: List[Stage], workers: int = 4):
+        """
+        Args:
+            name (str): the pipeline's name in the timing report, e.g. 'update'
+            stages (List[Stage]): every stage, in the order they'd run one by one
+            workers (int): the most stages allowed to run at once
+        """
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        self.workers = workers
+        self.depends = {}
+        for i, stage in enumerate(stages):
+            self.depends[stage.name] = {
+                earlier.name for earlier in stages[:i]
+                if set(earlier.outputs) & set(stage.inputs + stage.outputs)
+                or set(earlier.inputs) & set(stage.outputs)}
+
+    def downstream(self, name: str) -> List[str]:
+        """Returns a stage and every stage that depends on it, directly or
+        not, in the listed order
+        """
+        names = {name}
+        for stage in self.stages:
+            if self.depends[stage] & names:
+                names.add(stage)
+        return [stage for stage in self.stages if stage in names]
+
+    def select(self, only: List[str] = None, start: str = None) -> List[str]:
+        """Picks the stages to run: the ones named in only, or the start
+        stage and everything downstream of it, or else all of them
+        """
+        for name in (only or []) + ([start] if start else []):
+            if name not in self.stages:
+                raise ValueError(
+                    f"Unknown {self.name} stage {name}, choose from {', '.join(self.stages)}")
+        if only:
+            return [stage for stage in self.stages if stage in only]
+        if start:
+            return self.downstream(start)
+        return list(self.stages)
+
+    def run(self, names: List[str] = None) -> Dict:
+        """Runs the selected stages. Stages left out of the selection are
+        assumed to be done already. If a stage fails, no new stages start,
+        the running ones finish and the error is raised.
+
+        Returns:
+            Dict: stage name -> start offset and duration in seconds
+        """
+        names = names or list(self.stages)
+        waiting = {name: self.depends[name] & set(names) for name in names}
+        timings = {}
+        began = time.perf_counter()
+
+        def timed(name):
+            start = time.perf_counter()
+            self.stages[name].run()
+            timings[name] = {'start': round(start - began, 3),
+                             'seconds': round(time.perf_counter() - start, 3)}
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            running = {}
+            error = None
+            while waiting or running:
+                if error is None:
+                    for name in [name for name, needs in waiting.items() if not needs]:
+                        running[executor.submit(timed, name)] = name
+                        del waiting[name]
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() and error is None:
+                        error = future.exception()
+                    for needs in waiting.values():
+                        needs.discard(name)
+            if error is not None:
+                raise error
+        self.report(timings, time.perf_counter() - began)
+        return timings
+
+    def report(self, timings: Dict, elapsed: float) -> None:
+        """Prints the stage timings and saves them to db/timings.json under
+        the pipeline's name
+        """
+        for name in sorted(timings, key=lambda name: timings[name]['start']):
+            print(f"{name:<36} +{timings[name]['start']:7.2f}s "
+                  f"{timings[name]['seconds']:7.2f}s")
+        print(f"{self.name} finished in {elapsed:.2f}s")
+        try:
+            report = ReadWrite(TIMINGS).read()
+        except FileNotFoundError:
+            report = {}
+        report[self.name] = {'run': str(datetime.datetime.today()),
+                             'seconds': round(elapsed, 3), 'stages': timings}
+        ReadWrite(TIMINGS, report).write()
+
+    @staticmethod
+    def arguments(description: str, argv: List[str] = None) -> argparse.Namespace:
+        """Parses a pipeline's command line: --only runs just the named
+        stages, --from runs a stage and everything downstream of it and
+        --list prints each stage with the stages it waits for
+        """
+        parser = argparse.ArgumentParser(description=description)
+        parser.add_argument('--only', nargs='+', metavar='STAGE')
+        parser.add_argument('--from', dest='start', metavar='STAGE')
+        parser.add_argument('--workers', type=int)
+        parser.add_argument('--list', action='store_true')
+        return parser.parse_args(argv)
+
+    def list(self) -> None:
+        for name in self.stages:
+            print(f"{name:<36} after {', '.join(sorted(self.depends[name])) or '-'}")
+
+    def main(self, args: argparse.Namespace) -> Dict:
+        """Runs the stages picked on the command line (see arguments()), or
+        lists them with --list
+        """
+        if args.list:
+            self.list()
+            return {}
+        self.workers = args.workers or self.workers
+        return self.run(self.select(args.only, args.start))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+from typing import Dict, Iterable, List
+import random
+
+K = 200  # the top compactor's capacity, rank error is about 1.7 / K
+SHRINK = 2 / 3  # each lower compactor holds this much of the one above it
+
+
+class KLLSketch:
+    """A mergeable streaming quantile sketch (Karnin, Lang and Liberty's KLL).
+    Values go into a stack of compactors, compactor h holding values that
+    each stand for 2^h of the values seen. When the sketch is full the
+    lowest compactor over its capacity is sorted and every other value,
+    starting at random, moves up a level. Sketches of different weeks or
+    seasons merge into a sketch of all of them, so long histories never
+    need rescanning and the sketch stays O(K) however many values it saw.
+    """
+
+    def __init__(self, k: int = K, seed: int = None):
+        """
+        Args:
+            k (int): the top compactor's capacity, bigger is more accurate
+            seed (int, optional): seeds the compactions' coin flips
+        """
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(self.k * SHRINK ** depth))
+
+    def size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def update(self, value: float) -> None:
+        self.extend([value])
+
+    def extend(self, values: Iterable[float]) -> None:
+        before = len(self.compactors[0])
+        self.compactors[0].extend(values)
+        self.n += len(self.compactors[0]) - before
+        if len(self.compactors[0]) >= self.capacity(0):
+            self._compress()
+
+    def _compress(self) -> None:
+        while self.size() > sum(self.capacity(h) for h in range(len(self.compactors))):
+            for h, compactor in enumerate(self.compactors):
+                if len(compactor) >= self.capacity(h):
+                    if h + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    compactor.sort()
+                    # an odd value out stays behind
+                    kept = [compactor.pop()] if len(compactor) % 2 else []
+                    self.compactors[h + 1].extend(
+                        compactor[self._random.randint(0, 1)::2])
+                    self.compactors[h] = kept
+                    break
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Folds another sketch's values into this one
+
+        Returns:
+            KLLSketch: self
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for h, compactor in enumerate(other.compactors):
+            self.compactors[h].extend(compactor)
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs: List[float]) -> List[float]:
+        """Estimates several quantiles at once
+
+        Args:
+            qs (List[float]): quantiles between 0 and 1, e.g. [0.5, 0.9]
+
+        Returns:
+            List[float]: the smallest value seen with at least that share
+            of the values at or below it, None for an empty sketch
+        """
+        weighted = sorted((value, 2 ** h) for h, compactor in enumerate(self.compactors)
+                          for value in compactor)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for q in qs:
+            if not weighted:
+                results.append(None)
+                continue
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= q * total:
+                    break
+            results.append(value)
+        return results
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def to_dict(self) -> Dict:
+        return {'k': self.k, 'n': self.n, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: Dict, seed: int = None) -> 'KLLSketch':
+        sketch = cls(data['k'], seed)
+        sketch.n = data['n']
+        sketch.compactors = [list(compactor) for compactor in data['compactors']]
+        return sketch
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+from hashlib import sha256
+from json import dumps, loads
+from typing import Dict, List
+import argparse
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY, body TEXT NOT NULL, digest TEXT NOT NULL, version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS player_details (
+    ord INTEGER PRIMARY KEY, player_id TEXT UNIQUE, name TEXT, team TEXT, position TEXT,
+    depth INTEGER, status TEXT, injury_date TEXT, ref TEXT
+);
+CREATE INDEX IF NOT EXISTS player_details_depth ON player_details (depth, player_id, position);
+"""
+
+
+class SQLiteStore:
+    """Keeps the json db in a single SQLite file. Every file written under
+    root is stored whole in the documents table, so reads hand back exactly
+    what was written. Player details are also split into a table indexed by
+    depth, which players_by_depth() searches. Every other read loads its
+    whole document: the process stages look rosters up through
+    lib.roster.RosterIndex and weekly stats through StatHistory, both in
+    memory, so they aren't split into tables.
+    """
+
+    def __init__(self, path: str, root: str = './db'):
+        self.path = path
+        self.root = os.path.abspath(root)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads
+        if not hasattr(self._local, 'connection'):
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return self._local.connection
+
+    def name(self, destination: str) -> str:
+        """Returns the document name of a db file, or None if the file
+        isn't under the store's root
+        """
+        path = os.path.abspath(destination)
+        if os.path.commonpath([path, self.root]) != self.root:
+            return None
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def holds(self, destination: str) -> bool:
+        return self.name(destination) is not None
+
+    def read(self, destination: str):
+        row = self._connection().execute(
+            'SELECT body FROM documents WHERE name = ?', (self.name(destination),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No such document in {self.path}: '{destination}'")
+        return loads(row[0])
+
+    def version(self, destination: str) -> int:
+        row = self._connection().execute(
+            'SELECT version FROM documents WHERE name = ?', (self.name(destination),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No such document in {self.path}: '{destination}'")
+        return row[0]
+
+    def digest(self, destination: str) -> str:
+        row = self._connection().execute(
+            'SELECT digest FROM documents WHERE name = ?', (self.name(destination),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No such document in {self.path}: '{destination}'")
+        return row[0]
+
+    def write(self, destination: str, data) -> str:
+        """Stores a document and refreshes the tables built from it in one
+        transaction
+
+        Returns:
+            str: the sha256 of the document's json
+        """
+        name = self.name(destination)
+        body = dumps(data, ensure_ascii=False)
+        digest = sha256(body.encode('utf8')).hexdigest()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT INTO documents (name, body, digest, version) VALUES (?, ?, ?, 1) '
+                'ON CONFLICT (name) DO UPDATE SET body = excluded.body, digest = excluded.digest, '
+                'version = version + 1', (name, body, digest))
+            self._project(connection, name, data)
+        return digest
+
+    def _project(self, connection: sqlite3.Connection, name: str, data) -> None:
+        if name == 'player_details.json':
+            connection.execute('DELETE FROM player_details')
+            connection.executemany(
+                'INSERT OR REPLACE INTO player_details (player_id, name, team, position, depth, status, '
+                'injury_date, ref) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(player, details.get('name'), details.get('team'), details.get('position'),
+                  int(details.get('depth')), details.get('status'), details.get('injury_date'),
+                  details.get('ref'))
+                 for player, details in data.items()])
+
+    def players_by_depth(self, max_depth: int) -> Dict[str, str]:
+        """Every athlete no deeper than max_depth on their team's depth chart
+
+        Returns:
+            Dict: ESPN ID -> position, in player details order
+        """
+        return dict(self._connection().execute(
+            # the covering index beats scanning in ord order, sorting what it finds is cheap
+            'SELECT player_id, position FROM player_details INDEXED BY player_details_depth '
+            'WHERE depth <= ? ORDER BY ord', (max_depth,)))
+
+    def import_json(self, directory: str = None) -> List[str]:
+        """Copies every json file under a db directory into the store,
+        skipping the http cache, fixtures, journals, metrics and columnar
+        indexes
+
+        Returns:
+            List[str]: the names of the imported documents
+        """
+        directory = directory or self.root
+        imported = []
+        for folder, folders, files in os.walk(directory):
+            folders[:] = [name for name in folders
+                          if name not in ('http_cache', 'fixtures', 'journal', 'metrics')]
+            for file in sorted(files):
+                if not file.endswith('.json') or file.endswith('.index.json'):
+                    continue
+                path = os.path.join(folder, file)
+                name = os.path.relpath(path, directory).replace(os.sep, '/')
+                with open(path, 'rb') as jf:
+                    data = loads(jf.read())
+                self.write(os.path.join(self.root, name), data)
+                imported.append(name)
+        return imported
+
+
+def main():
+    """To Run: python3 -m lib.sqlite_store ./db ./db/nfl.sqlite
+        Imports an existing json db, then set Settings.BACKEND = 'sqlite'
+    """
+    parser = argparse.ArgumentParser(
+        description='Import the json db into SQLite')
+    parser.add_argument('directory', nargs='?', default='./db')
+    parser.add_argument('database', nargs='?', default='./db/nfl.sqlite')
+    args = parser.parse_args()
+    store = SQLiteStore(args.database, args.directory)
+    for name in store.import_json():
+        print(f'imported {name}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lib.db_utils import Client, GetData, LazyFile, ReadWrite, page_url, query_all, query_pages
+from lib.columnar import WeeklySnapshot
+from lib.http_cache import ResponseCache
+from lib.journal import Journal
+from lib.metrics import endpoint
+from lib.rate_limit import RateLimiter, retry_after
+from requests import Response
+from unittest import mock
+from lib.constants import Inputs, Lists, RunContext
+from lib.replay import FixtureArchive, StandIn
+from lib.roster import RosterIndex
+from lib.scheduler import Scheduler, Stage
+from lib.sketch import KLLSketch
+from lib.sqlite_store import SQLiteStore
+from lib.testing import InTempDir
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # path -> list of status codes to answer with, in order
+    responses = {}
+    hits = {}
+
+    def do_GET(self):
+        MockHandler.hits[self.path] = MockHandler.hits.get(self.path, 0) + 1
+        statuses = MockHandler.responses.get(self.path, [200])
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if status == 200 and self.headers.get('If-None-Match') == '"v1"':
+            status = 304
+        body = b'{"id": "1"}' if status == 200 else b''
+        if status == 200 and self.path.startswith('/collection'):
+            # three pages of one item each, the item is its page number
+            page = self.path.split('page=')[-1]
+            body = f'{{"pageCount": 3, "items": [{page}]}}'.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        MockHandler.responses = {}
+        MockHandler.hits = {}
+
+
+class TestClient(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client(retries=2, backoff=0)
+
+    def test_query_single_request(self):
+        test = GetData(f'{self.url}/athlete', self.client).query()
+        self.assertEqual(test, {"id": "1"})
+        self.assertEqual(MockHandler.hits['/athlete'], 1)
+
+    def test_query_retries(self):
+        MockHandler.responses['/flaky'] = [503, 200]
+        test = GetData(f'{self.url}/flaky', self.client).query()
+        self.assertEqual(test, {"id": "1"})
+        self.assertEqual(MockHandler.hits['/flaky'], 2)
+
+    def test_query_gives_up(self):
+        MockHandler.responses['/down'] = [503]
+        test = GetData(f'{self.url}/down', self.client).query()
+        self.assertEqual(test, {})
+        self.assertEqual(MockHandler.hits['/down'], 3)
+
+    def test_query_not_found(self):
+        MockHandler.responses['/missing'] = [404]
+        test = GetData(f'{self.url}/missing', self.client).query()
+        self.assertEqual(test, {})
+        self.assertEqual(MockHandler.hits['/missing'], 1)
+
+    def test_query_all_order(self):
+        MockHandler.responses['/athlete/2'] = [404]
+        urls = {str(i): f'{self.url}/athlete/{i}' for i in range(5, 0, -1)}
+        test = query_all(urls, workers=3)
+        self.assertEqual(list(test), ['5', '4', '3', '2', '1'])
+        self.assertEqual(test['2'], {})
+        self.assertEqual(test['5'], {"id": "1"})
+
+    def test_query_all_connection_error(self):
+        client = Client(retries=0, backoff=0)
+        urls = {'up': f'{self.url}/athlete/1', 'down': 'http://127.0.0.1:9/athlete'}
+        with mock.patch('lib.db_utils._client', client):
+            test = query_all(urls, workers=2)
+        self.assertEqual(test, {'up': {"id": "1"}, 'down': {}})
+        self.assertEqual(client.failed, 1)
+
+    def test_query_all_priority(self):
+        urls = {str(i): f'{self.url}/athlete/{i}' for i in range(4)}
+        query_all(urls, workers=1, priority={'3': 1, '1': 2})
+        self.assertEqual(list(MockHandler.hits), [
+                         '/athlete/3', '/athlete/1', '/athlete/0', '/athlete/2'])
+
+    def test_limiter(self):
+        MockHandler.responses['/throttled'] = [429, 200]
+        limiter = RateLimiter(rate=None, concurrency=4)
+        client = Client(retries=1, backoff=0, limiter=limiter)
+        test = GetData(f'{self.url}/throttled', client).query()
+        self.assertEqual(test, {"id": "1"})
+        self.assertEqual(limiter.stats['throttled'], 1)
+        self.assertEqual(limiter.window, 2.5)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_metrics(self):
+        MockHandler.responses['/athletes/7/statistics/0'] = [503, 404]
+        GetData(f'{self.url}/athletes/7/statistics/0', self.client).query()
+        GetData(f'{self.url}/athletes/8/statistics/0', self.client).query()
+        self.assertEqual(endpoint('https://host/athletes/7/statistics/0?lang=en'),
+                         'host/athletes/{id}/statistics/{id}')
+        test = self.client.metrics.summary()['endpoints'][
+            endpoint(f'{self.url}/athletes/7/statistics/0')]
+        self.assertEqual((test['requests'], test['sent'], test['retries'], test['bytes']),
+                         (2, 3, 1, len('{"id": "1"}')))
+        self.assertEqual(test['statuses'], {'503': 1, '404': 1})
+        self.assertIsNotNone(test['latency']['p99'])
+
+    def test_page_url(self):
+        test = page_url('http://host/athletes?lang=en&region=us', 2, 50)
+        self.assertEqual(
+            test, 'http://host/athletes?lang=en&region=us&limit=50&page=2')
+
+    def test_query_pages(self):
+        test = query_pages({'a': f'{self.url}/collection/a',
+                            'b': f'{self.url}/collection/b'}, limit=1)
+        self.assertEqual(test['a']['items'], [1, 2, 3])
+        self.assertEqual(test['b']['items'], [1, 2, 3])
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_window(self):
+        limiter = RateLimiter(rate=None, concurrency=8, min_concurrency=2)
+        for status in (429, None, 503):
+            limiter.acquire()
+            limiter.release(status)
+        self.assertEqual(limiter.window, 2)
+        limiter.acquire()
+        limiter.release(200)
+        self.assertEqual(limiter.window, 2.5)
+
+    def test_tokens(self):
+        limiter = RateLimiter(rate=1000, burst=1)
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(200)
+        self.assertLess(limiter.tokens, 1)
+
+    def test_retry_after(self):
+        response = Response()
+        response.headers['Retry-After'] = '7'
+        self.assertEqual(retry_after(response), 7)
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(retry_after(response), 0)
+        response.headers['Retry-After'] = 'soon'
+        self.assertIsNone(retry_after(response))
+        limiter = RateLimiter(rate=None)
+        limiter.acquire()
+        limiter.release(429, 0.05)
+        self.assertGreater(limiter.paused_until, 0)
+
+
+class TestResponseCache(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.directory.name)
+        self.client = Client(retries=0, backoff=0, cache=self.cache)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cache_hit(self):
+        first = GetData(f'{self.url}/cached', self.client).query()
+        second = GetData(f'{self.url}/cached', self.client).query()
+        self.assertEqual(first, second)
+        self.assertEqual(MockHandler.hits['/cached'], 1)
+        self.assertEqual(self.cache.stats, {
+                         'hits': 1, 'misses': 1, 'revalidations': 0})
+
+    def test_cache_revalidation(self):
+        self.cache.ttls = [('/', 0)]
+        GetData(f'{self.url}/stale', self.client).query()
+        test = GetData(f'{self.url}/stale', self.client).query()
+        self.assertEqual(test, {"id": "1"})
+        self.assertEqual(MockHandler.hits['/stale'], 2)
+        self.assertEqual(self.cache.stats['revalidations'], 1)
+
+    def test_cache_evicted_after_lookup(self):
+        GetData(f'{self.url}/cached', self.client).query()
+        lookup = self.cache.lookup
+
+        def evicting_lookup(url):
+            # another thread evicts the entry right after it's looked up
+            entry = lookup(url)
+            os.remove(os.path.join(self.directory.name, f"{entry['key']}.body"))
+            return entry
+
+        with mock.patch.object(self.cache, 'lookup', evicting_lookup):
+            test = GetData(f'{self.url}/cached', self.client).query()
+        self.assertEqual(test, {"id": "1"})
+        self.assertEqual(MockHandler.hits['/cached'], 2)
+        self.assertEqual(self.cache.stats, {
+                         'hits': 0, 'misses': 2, 'revalidations': 0})
+
+    def test_cache_eviction(self):
+        self.cache.max_bytes = 30
+        GetData(f'{self.url}/a', self.client).query()
+        GetData(f'{self.url}/b', self.client).query()
+        GetData(f'{self.url}/c', self.client).query()
+        self.assertIsNone(self.cache.lookup(f'{self.url}/a'))
+        self.assertIsNotNone(self.cache.lookup(f'{self.url}/c'))
+
+
+class TestReplay(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = FixtureArchive(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_replay(self):
+        MockHandler.responses['/missing'] = [404]
+        recorder = Client(archive=self.archive, mode='record')
+        GetData(f'{self.url}/athlete', recorder).query()
+        GetData(f'{self.url}/missing', recorder).query()
+        self.server.shutdown()
+        try:
+            replay = Client(archive=self.archive, mode='replay')
+            self.assertEqual(
+                GetData(f'{self.url}/athlete', replay).query(), {"id": "1"})
+            self.assertEqual(
+                GetData(f'{self.url}/missing', replay).query(), {})
+            self.assertEqual(
+                GetData(f'{self.url}/unrecorded', replay).query(), {})
+            self.assertEqual(self.archive.missing, 1)
+        finally:
+            threading.Thread(target=self.server.serve_forever,
+                             daemon=True).start()
+
+    def test_standin(self):
+        Client(archive=self.archive, mode='record').get(
+            f'{self.url}/athlete')
+        standin = StandIn(self.archive).start()
+        try:
+            client = Client(standin=standin.url)
+            self.assertEqual(
+                GetData(f'{self.url}/athlete', client).query(), {"id": "1"})
+            self.assertEqual(MockHandler.hits['/athlete'], 1)
+            standin.error_rate = 1.0
+            client = Client(standin=standin.url, retries=0)
+            self.assertEqual(client.get(f'{self.url}/athlete').status_code, 503)
+        finally:
+            standin.stop()
+
+
+class TestRunContext(unittest.TestCase):
+
+    def test_context(self):
+        self.assertEqual(RunContext.current(), RunContext(Inputs.YEAR, Inputs.WEEK))
+        def season(ctx):
+            return ctx.SEASON, ctx.SEASON_VAL, ctx.SEASON_WEEK
+        regular = RunContext(2021, 17)
+        self.assertEqual(season(regular), ('regular', 2, 17))
+        # week 18 is a regular season week from 2021 on
+        self.assertEqual(season(RunContext(2021, 18)), ('regular', 2, 18))
+        self.assertEqual(season(RunContext(2021, 20)), ('postseason', 3, 2))
+        self.assertEqual(season(RunContext(2020, 18)), ('postseason', 3, 1))
+        self.assertEqual(season(RunContext(2020, 17)), ('regular', 2, 17))
+        self.assertEqual(regular.stats_path(16), './db/2021_stats/week_16.json')
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal', 'run.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        journal.record('stats', '1', {'sacks': 1.0})
+        journal.finish('update_results')
+        # a crash part way through writing the next line
+        with open(self.path, 'a') as jf:
+            jf.write('{"stage": "stats", "ke')
+        test = Journal(self.path)
+        self.assertTrue(test.resumed)
+        self.assertEqual(test.done('stats'), {'1': {'sacks': 1.0}})
+        self.assertTrue(test.finished('update_results'))
+        self.assertFalse(test.finished('stats'))
+        test.record('stats', '2', {})
+        self.assertEqual(list(Journal(self.path).done('stats')), ['1', '2'])
+
+    def test_clear(self):
+        journal = Journal(self.path)
+        journal.record('stats', '1', {})
+        journal.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(Journal(self.path).resumed)
+
+
+class TestLazyFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stats.json')
+
+        class Files:
+            STATS = LazyFile(self.path)
+        self.files = Files
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lazy_load(self):
+        ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        stats = self.files.STATS
+        stats["2"] = {}
+        self.assertIs(self.files.STATS, stats)
+
+    def test_reload_on_change(self):
+        ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        self.assertEqual(self.files.STATS, {"1": {"sacks": 1.0}})
+        ReadWrite(self.path, {"1": {"sacks": 2.0}, "2": {}}).write()
+        self.assertEqual(self.files.STATS, {"1": {"sacks": 2.0}, "2": {}})
+
+    def test_save_while_reading(self):
+        ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        stats = self.files.STATS
+        stats["2"] = {}
+        version = ReadWrite.version
+        saves = []
+
+        def save_during_version(rw):
+            # another thread saves right after this one reads the stamp
+            if not saves:
+                saves.append(threading.Thread(target=vars(self.files)['STATS'].save))
+                saves[0].start()
+                saves[0].join(0.2)
+            return version(rw)
+
+        with mock.patch.object(ReadWrite, 'version', save_during_version):
+            self.assertIs(self.files.STATS, stats)
+        saves[0].join()
+        self.assertIs(self.files.STATS, stats)
+        self.assertEqual(ReadWrite(self.path).read(), {"1": {"sacks": 1.0}, "2": {}})
+
+
+class TestReadWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stats.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_snapshot_read(self):
+        data = {"1": {"sacks": 1.0, "QBR": None}, "2": {}}
+        ReadWrite(self.path, data).write()
+        self.assertEqual(ReadWrite(self.path)._read_snapshot(), (data,))
+        self.assertEqual(ReadWrite(self.path).read(), data)
+
+    def test_stale_snapshot(self):
+        ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        self.assertEqual(ReadWrite(self.path).read(), {"1": {"sacks": 1.0}})
+        with open(self.path, 'w') as jf:
+            jf.write('{"2": {}}')
+        self.assertEqual(ReadWrite(self.path).read(), {"2": {}})
+        self.assertEqual(ReadWrite(self.path)._read_snapshot(), ({"2": {}},))
+
+    def test_atomic_write(self):
+        ReadWrite(self.path, {"1": {}}).write()
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [
+            'stats.json', 'stats.json.lock', 'stats.json.marshal', 'stats.json.sha256'])
+
+    def test_digest(self):
+        first = ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        self.assertEqual(ReadWrite(self.path).digest(), first)
+        second = ReadWrite(self.path, {"1": {"sacks": 1.0}}).write()
+        self.assertEqual(first, second)
+        with open(self.path, 'w') as jf:
+            jf.write('{"2": {}}')
+        self.assertNotEqual(ReadWrite(self.path).digest(), first)
+
+    def test_concurrent_read_write(self):
+        ReadWrite(self.path, {"1": {}}).write()
+        errors = []
+
+        def write():
+            for week in range(50):
+                ReadWrite(self.path, {str(i): {"week": week}
+                          for i in range(500)}).write()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while writer.is_alive():
+            try:
+                ReadWrite(self.path).read()
+            except ValueError as error:
+                errors.append(error)
+        writer.join()
+        self.assertEqual(errors, [])
+
+
+class TestWeeklySnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'week_7.json')
+        self.stats = {
+            "1": {"rushingYards": 120.0, "sacks": 0.0},
+            "2": {"receivingYards": 64.0},
+            "3": {},
+        }
+        WeeklySnapshot(self.path).write(self.stats)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        test = WeeklySnapshot(self.path)
+        self.assertTrue(test.exists())
+        self.assertEqual(test.to_dict(), self.stats)
+
+    def test_stale_copy(self):
+        ReadWrite(self.path, self.stats).write()
+        WeeklySnapshot(self.path).write(self.stats)
+        self.assertTrue(WeeklySnapshot(self.path).exists())
+        # the json rewritten without the columnar copy
+        ReadWrite(self.path, {"1": {"sacks": 2.0}}).write()
+        self.assertFalse(WeeklySnapshot(self.path).exists())
+        # exporting writes the json back from the copy and stamps it again
+        WeeklySnapshot(self.path).export_json()
+        self.assertTrue(WeeklySnapshot(self.path).exists())
+        self.assertEqual(ReadWrite(self.path).read(), self.stats)
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = os.path.join(self.directory.name, 'db')
+        self.store = SQLiteStore(os.path.join(
+            self.directory.name, 'nfl.sqlite'), root)
+        self.depth_chart = ReadWrite('./update/mocks/depth_chart.json').read()
+        self.details = ReadWrite('./update/mocks/player_details.json').read()
+        self.store.write(f'{root}/depth_chart.json',
+                         {'atlanta falcons': self.depth_chart})
+        self.store.write(f'{root}/player_details.json', self.details)
+        self.root = root
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        test = self.store.read(f'{self.root}/player_details.json')
+        self.assertEqual(test, self.details)
+        self.assertFalse(self.store.holds('./update/mocks/stats.json'))
+        with self.assertRaises(FileNotFoundError):
+            self.store.read(f'{self.root}/stats.json')
+
+    def test_players_by_depth(self):
+        test = self.store.players_by_depth(1)
+        expected = {player: details['position'] for player, details in self.details.items()
+                    if details['depth'] == "1"}
+        self.assertEqual(test, expected)
+        plan = self.store._connection().execute(
+            'EXPLAIN QUERY PLAN SELECT player_id, position FROM player_details '
+            'INDEXED BY player_details_depth WHERE depth <= 1').fetchall()
+        self.assertIn('COVERING INDEX player_details_depth', plan[0][-1])
+
+
+class TestRosterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.depth_chart = ReadWrite('./process/mocks/depth_chart.json').read()
+        details = ReadWrite('./process/mocks/player_details.json').read()
+        self.roster = RosterIndex(
+            {'atlanta falcons': self.depth_chart}, details)
+
+    def test_starter(self):
+        test = self.roster.starter('atlanta falcons').id
+        self.assertEqual(test, self.depth_chart['quarterback']['1']['id'])
+
+    def test_group(self):
+        test = [slot.position for slot in self.roster.group(
+            'atlanta falcons', 'offensive line') if slot.depth == "1"]
+        expected = [position for position in self.depth_chart
+                    if position in Lists.offensive_line]
+        self.assertEqual(test, expected)
+
+    def test_team_order(self):
+        test = [slot.id for slot in self.roster.team('atlanta falcons')]
+        expected = [self.depth_chart[position][depth]['id']
+                    for position in self.depth_chart for depth in self.depth_chart[position]]
+        self.assertEqual(test, expected)
+
+
+class TestScheduler(InTempDir, unittest.TestCase):
+
+    def setUp(self):
+        self.ran = []
+        super().setUp()
+
+    def stage(self, name, inputs=(), outputs=(), wait=None):
+        def run():
+            # the stage waits for another to start, so they must overlap
+            if wait and not wait.wait(5):
+                raise TimeoutError(name)
+            self.ran.append(name)
+        return Stage(name, run, inputs, outputs)
+
+    def test_dependencies(self):
+        scheduler = Scheduler('test', [
+            self.stage('a', outputs=('a.json',)),
+            self.stage('b', inputs=('a.json',), outputs=('b.json',)),
+            self.stage('c', outputs=('c.json',)),
+            self.stage('d', inputs=('b.json',), outputs=('a.json',)),
+        ])
+        self.assertEqual(scheduler.depends, {'a': set(), 'b': {'a'}, 'c': set(),
+                                             'd': {'a', 'b'}})
+        self.assertEqual(scheduler.select(start='b'), ['b', 'd'])
+        self.assertEqual(scheduler.select(only=['d', 'c']), ['c', 'd'])
+        with self.assertRaises(ValueError):
+            scheduler.select(only=['e'])
+
+    def test_run(self):
+        started = threading.Event()
+        first = self.stage('first', outputs=('first.json',))
+        scheduler = Scheduler('test', [
+            Stage('slow', lambda: started.set() or self.ran.append('slow'), (), ('slow.json',)),
+            self.stage('fast', outputs=('fast.json',), wait=started),
+            first,
+            self.stage('second', inputs=('first.json',)),
+        ])
+        timings = scheduler.run()
+        self.assertEqual(set(timings), {'slow', 'fast', 'first', 'second'})
+        self.assertLess(self.ran.index('first'), self.ran.index('second'))
+        self.assertIn('test', ReadWrite('./db/timings.json').read())
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError('stage failed')
+        scheduler = Scheduler('test', [
+            Stage('a', fail, (), ('a.json',)),
+            self.stage('b', inputs=('a.json',)),
+        ])
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+        self.assertEqual(self.ran, [])
+
+    def test_main(self):
+        scheduler = Scheduler('test', [
+            self.stage('a', outputs=('a.json',)),
+            self.stage('b', inputs=('a.json',)),
+        ])
+        self.assertEqual(scheduler.main(Scheduler.arguments('test', ['--list'])), {})
+        self.assertEqual(self.ran, [])
+        scheduler.main(Scheduler.arguments('test', ['--only', 'b', '--workers', '2']))
+        self.assertEqual((self.ran, scheduler.workers), (['b'], 2))
+
+
+class TestKLLSketch(unittest.TestCase):
+
+    def test_quantiles(self):
+        values = [(i * 7919) % 100000 for i in range(100000)]
+        sketch = KLLSketch(seed=1)
+        sketch.extend(values)
+        self.assertLess(sketch.size(), 1000)
+        for q, estimate in zip([0.5, 0.9, 0.99], sketch.quantiles([0.5, 0.9, 0.99])):
+            self.assertAlmostEqual(estimate / 100000, q, delta=0.02)
+
+    def test_merge(self):
+        first, second = KLLSketch(seed=1), KLLSketch(seed=2)
+        first.extend(range(0, 50000))
+        second.extend(range(50000, 100000))
+        merged = KLLSketch.from_dict(first.to_dict()).merge(second)
+        self.assertEqual(merged.n, 100000)
+        self.assertAlmostEqual(merged.quantile(0.9) / 100000, 0.9, delta=0.02)
+        # small sketches are exact
+        self.assertEqual(KLLSketch().quantiles([0.5, 1]), [None, None])
+        small = KLLSketch()
+        small.extend([3, 1, 2])
+        self.assertEqual(small.quantiles([0, 0.5, 1]), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+
+
+class InTempDir:
+    """A unittest.TestCase mixin that runs each test from a fresh temporary
+    directory holding an empty db/, so everything written to ./db lands
+    there instead of the real db. Read the repo's mocks before calling
+    super().setUp(), their relative paths don't resolve after it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        os.makedirs('db')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+        super().tearDown()
@@ -1,13 +1,17 @@
-from lib.constants import Files, Lists
+from lib.constants import Files, Inputs, Lists
 from lib.db_utils import ReadWrite
-from typing import Dict, Tuple
+from lib.columnar import WeeklySnapshot
+from lib.roster import RosterIndex
+from typing import Dict, List, Tuple
+import numpy as np
+import os
 
 
 class ProcessStats:
     """_summary_
     """
 
-    def __init__(self, team, stats):
+    def __init__(self, team, stats, qb_id=None):
         self.processed_stats = {
             'quarterback': 0,
             'receiving': 0,
@@ -17,6 +21,8 @@ class ProcessStats:
         }
         self.stats = stats
         self.team = team
+        # the team's starting QB, looked up on the first receiver when not given
+        self.qb_id = qb_id
 
     def _get_stat(self, stat: str, id: str) -> float:
         """_summary_
@@ -54,8 +60,9 @@ class ProcessStats:
             stats (Dict): _description_
             team (str): _description_
         """
-        qb_id = Files.DEPTH_CHART[self.team]['quarterback']["1"]['id']
-        interception_pct = self._get_stat('interception_pct', qb_id)
+        if self.qb_id is None:
+            self.qb_id = Files.DEPTH_CHART[self.team]['quarterback']["1"]['id']
+        interception_pct = self._get_stat('interception_pct', self.qb_id)
         impact = self._get_stat('receiving_yds_per_game', id)
         negative_probability = (self._get_stat(
             'play_pct', id) * interception_pct)
@@ -103,45 +110,176 @@ class ProcessStats:
         return self.processed_stats
 
 
+class StatHistory:
+    """A season's weekly stat snapshots as one athlete x stat x week array,
+    each snapshot read from disk once per process however many histories
+    use it. Every stat's week over week delta is worked out for every
+    athlete at once the way StatDeltas always has: this week's value less
+    last week's, this week's alone when last week had none and nothing
+    when this week has none or the athlete is missing from either week.
+    Team and opponent totals are then sums over the athletes asked for.
+    """
+
+    _weeks = {}  # path -> (version, athletes, stats, athlete x stat matrix, present)
+    _shared = {}  # (year, weeks) -> the last StatHistory built for them
+
+    def __init__(self, weeks: List[int], year: int = None):
+        """
+        Args:
+            weeks (List[int]): the weeks whose deltas are wanted, the week
+            before each one is loaded too
+            year (int, optional): the season, Inputs.YEAR when omitted
+
+        Raises:
+            FileNotFoundError: a week or the week before it has no snapshot
+        """
+        self.year = year or Inputs.YEAR
+        wanted = sorted({int(week) for week in weeks})
+        self.weeks = {week: i for i, week in enumerate(
+            sorted(set(wanted) | {week - 1 for week in wanted}))}
+        self.versions = [self.version(week, self.year) for week in self.weeks]
+        loaded = [self.load_week(week, self.year) for week in self.weeks]
+
+        self.athletes = {}
+        self.stats = {}
+        for athletes, stats, _, _ in loaded:
+            for athlete in athletes:
+                self.athletes.setdefault(athlete, len(self.athletes))
+            for stat in stats:
+                self.stats.setdefault(stat, len(self.stats))
+        self.values = np.full((len(self.athletes), len(self.stats), len(self.weeks)), np.nan)
+        self.present = np.zeros((len(self.athletes), len(self.weeks)), dtype=bool)
+        for i, (athletes, stats, matrix, present) in enumerate(loaded):
+            rows = np.array([self.athletes[athlete] for athlete in athletes], dtype=np.intp)
+            columns = np.array([self.stats[stat] for stat in stats], dtype=np.intp)
+            self.values[np.ix_(rows, columns, [i])] = matrix[:, :, None]
+            self.present[rows, i] = present
+
+        # deltas[..., i] is the change into the i'th loaded week from the week
+        # before it, counted where StatDeltas would have added the delta
+        previous = np.array([self.weeks.get(week - 1, -1) for week in self.weeks], dtype=np.intp)
+        this = self.values
+        last = np.where(previous >= 0, self.values[:, :, previous], np.nan)
+        played = (this == this) & (this != 0)
+        before = (last == last) & (last != 0)
+        self.deltas = np.where(played & before, this - last, np.where(played, this, 0.0))
+        self.counted = played & (self.present & np.where(
+            previous >= 0, self.present[:, previous], False))[:, None, :]
+
+    @classmethod
+    def shared(cls, weeks: List[int], year: int = None) -> 'StatHistory':
+        """Returns the history last built for the same weeks, building it
+        again only when one of their snapshots has changed
+        """
+        year = year or Inputs.YEAR
+        key = (year, tuple(sorted({int(week) for week in weeks})))
+        history = cls._shared.get(key)
+        if history is None or history.versions != [
+                cls.version(week, year) for week in history.weeks]:
+            history = cls._shared[key] = cls(weeks, year)
+        return history
+
+    @staticmethod
+    def version(week: int, year: int):
+        """Returns a value that changes every time a weekly snapshot is written
+        """
+        snapshot = WeeklySnapshot(f'./db/{year}_stats/week_{week}.json')
+        if snapshot.exists():
+            return [os.stat(snapshot.values_path).st_mtime_ns,
+                    os.stat(snapshot.index_path).st_mtime_ns]
+        return ReadWrite(snapshot.path).version()
+
+    @classmethod
+    def load_week(cls, week: int, year: int) -> Tuple[List[str], List[str], np.ndarray, np.ndarray]:
+        """Reads a weekly snapshot, from its columnar copy when there is one,
+        reusing what was read last time until the snapshot changes
+
+        Returns:
+            Tuple: the athletes, the stats, an athlete x stat matrix (NaN
+            where missing) and whether each athlete has any stats
+        """
+        path = f'./db/{year}_stats/week_{week}.json'
+        snapshot = WeeklySnapshot(path)
+        version = cls.version(week, year)
+        key = os.path.abspath(path)
+        cached = cls._weeks.get(key)
+        if cached and cached[0] == version:
+            return cached[1:]
+
+        if snapshot.exists():
+            matrix = snapshot.matrix().T
+            loaded = (snapshot.athletes, snapshot.stats, matrix, (matrix == matrix).any(axis=1))
+        else:
+            rows = ReadWrite(path).read()
+            stats = list(dict.fromkeys(stat for row in rows.values() for stat in row))
+            columns = {stat: i for i, stat in enumerate(stats)}
+            matrix = np.full((len(rows), len(stats)), np.nan)
+            for i, row in enumerate(rows.values()):
+                for stat, value in row.items():
+                    matrix[i, columns[stat]] = np.nan if value is None else value
+            loaded = (list(rows), stats, matrix,
+                      np.array([bool(row) for row in rows.values()], dtype=bool))
+        cls._weeks[key] = (version, *loaded)
+        return loaded
+
+    def total(self, week: int, ids: List[str], stat: str) -> float:
+        """Adds up a stat's deltas into a week over some athletes, in the
+        order given, the same as calling StatDeltas' setter for each one
+
+        Returns:
+            float: the total, the int 0 when no athlete had a delta
+        """
+        rows = [self.athletes[id] for id in ids if id in self.athletes]
+        if stat not in self.stats or not rows:
+            return 0
+        week, stat = self.weeks[int(week)], self.stats[stat]
+        counted = self.counted[rows, stat, week]
+        if not counted.any():
+            return 0
+        # a running sum, so the total comes out exactly as it always has
+        return np.cumsum(self.deltas[rows, stat, week][counted])[-1].item()
+
+    def totals(self, teams: Dict[str, List[str]], week: int, stats: List[str]) -> Dict:
+        """total for several teams' athletes at once
+
+        Args:
+            teams (Dict[str, List[str]]): team -> ESPN IDs of its athletes
+            week (int): the week
+            stats (List[str]): the stats to add up
+
+        Returns:
+            Dict: team -> stat -> total
+        """
+        return {team: {stat: self.total(week, ids, stat) for stat in stats}
+                for team, ids in teams.items()}
+
+
 class StatDeltas:
-    def __init__(self, week):
-        self.stat0 = ReadWrite(
-            f'./db/2022_stats/week_{int(week) - 1}.json').read()
-        self.stat1 = ReadWrite(f'./db/2022_stats/week_{week}.json').read()
+    """One week's rushing, receiving and sack deltas added up an athlete at
+    a time, read from the StatHistory shared by every StatDeltas of the week
+    """
+    stats = {'rushing': 'rushingYards', 'receiving': 'receivingYards', 'sacks': 'sacks'}
+
+    def __init__(self, week, year: int = None):
+        self.week = int(week)
+        self.history = StatHistory.shared([self.week], year)
         self.stat_deltas = {
             'rushing': 0,
             'receiving': 0,
             'sacks': 0,
         }
 
-    def _get_delta(self, stats):
-        # played both games
-        if stats[0] and stats[1]:
-            return stats[0] - stats[1]
-        # only played recent week
-        elif stats[0] and not stats[1]:
-            return stats[0]
-        # didn't play recent week
-        else:
-            return 0
+    def _add(self, delta: str, id) -> None:
+        self.stat_deltas[delta] += self.history.total(self.week, [id], self.stats[delta])
 
     def set_rushing(self, id):
-        if self.stat0.get(id) and self.stat1.get(id):
-            delta = self._get_delta([self.stat1[id].get(
-                "rushingYards"), self.stat0[id].get("rushingYards")])
-            self.stat_deltas['rushing'] += delta
+        self._add('rushing', id)
 
     def set_receiving(self, id):
-        if self.stat0.get(id) and self.stat1.get(id):
-            delta = self._get_delta([self.stat1[id].get(
-                "receivingYards"), self.stat0[id].get("receivingYards")])
-            self.stat_deltas['receiving'] += delta
+        self._add('receiving', id)
 
     def set_sacks(self, id):
-        if self.stat0.get(id) and self.stat1.get(id):
-            delta = self._get_delta([self.stat1[id].get(
-                "sacks"), self.stat0[id].get("sacks")])
-            self.stat_deltas['sacks'] += delta
+        self._add('sacks', id)
 
     def get_stat_deltas(self):
         return self.stat_deltas
@@ -264,3 +402,423 @@ def filter_stats(stats: Dict, position: str, team: str) -> Dict:
         return get_defense()
     else:
         return {}
+
+
+# The derived stats of each position group in filter_stats' key order: a
+# key with a divisor is numerator / divisor, without one the raw stat as is.
+# 'targets' and 'touches' are receivingTargets and receivingTargets +
+# rushingAttempts with a missing value counted as 0, 'qb_plays' is the
+# totalOffensivePlays of the player's team's starting quarterback.
+FILTERS = {
+    'quarterback': (
+        ('QBR', 'QBR', None),
+        ('passing_pct', 'passingAttempts', 'totalOffensivePlays'),
+        ('completion_pct', 'completions', 'passingAttempts'),
+        ('interception_pct', 'interceptionPct', 100),
+        ('passing_yds_per_game', 'passingYards', 'gamesPlayed'),
+        ('rushing_pct', 'rushingAttempts', 'totalOffensivePlays'),
+        ('rush_yds_per_attempt', 'rushingYards', 'rushingAttempts'),
+        ('rush_yds_per_game', 'rushingYards', 'gamesPlayed'),
+        ('stuffs_pct', 'stuffs', 'rushingAttempts'),
+    ),
+    'running back': (
+        ('RBR', 'ESPNRBRating', None),
+        ('play_pct', 'touches', 'qb_plays'),
+        ('yds_per_game', 'yardsPerGame', None),
+        ('rushing_yds_per_game', 'rushingYards', 'gamesPlayed'),
+        ('rushing_yds_per_attempt', 'rushingYards', 'rushingAttempts'),
+        ('rushing_fumbles_pct', 'rushingFumbles', 'rushingAttempts'),
+        ('stuffs_pct', 'stuffs', 'rushingAttempts'),
+        ('reception_pct', 'receptions', 'receivingTargets'),
+        ('yds_per_reception', 'receivingYards', 'receptions'),
+        ('yds_after_catch', 'receivingYardsAfterCatch', 'receptions'),
+    ),
+    'wide receiver': (
+        ('WRR', 'ESPNWRRating', None),
+        ('play_pct', 'targets', 'qb_plays'),
+        ('reception_pct', 'receptions', 'receivingTargets'),
+        ('yds_per_reception', 'receivingYards', 'receptions'),
+        ('receiving_yds_per_game', 'receivingYards', 'gamesPlayed'),
+        ('yds_per_game', 'yardsPerGame', None),
+        ('yds_after_catch', 'receivingYardsAfterCatch', 'receptions'),
+    ),
+    'tight end': (
+        ('RBR', 'ESPNRBRating', None),
+        ('WRR', 'ESPNWRRating', None),
+        ('play_pct', 'touches', 'qb_plays'),
+        ('yds_per_game', 'yardsPerGame', None),
+        ('receiving_yds_per_game', 'receivingYards', 'gamesPlayed'),
+        ('rushing_yds_per_game', 'rushingYards', 'gamesPlayed'),
+        ('rushing_yds_per_attempt', 'rushingYards', 'rushingAttempts'),
+        ('rushing_fumbles_pct', 'rushingFumbles', 'rushingAttempts'),
+        ('stuffs_pct', 'stuffs', 'rushingAttempts'),
+        ('reception_pct', 'receptions', 'receivingTargets'),
+        ('yds_per_reception', 'receivingYards', 'receptions'),
+        ('yds_after_catch', 'receivingYardsAfterCatch', 'receptions'),
+    ),
+    'secondary': (
+        ('fumbles', 'fumblesForced', 'gamesPlayed'),
+        ('tackles', 'totalTackles', 'gamesPlayed'),
+        ('interceptions', 'interceptions', 'gamesPlayed'),
+        ('passes_defended', 'passesDefended', 'gamesPlayed'),
+    ),
+    'defense': (
+        ('fumbles', 'fumblesForced', 'gamesPlayed'),
+        ('tackles', 'totalTackles', 'gamesPlayed'),
+        ('interceptions', 'interceptions', 'gamesPlayed'),
+        ('passes_defended', 'passesDefended', 'gamesPlayed'),
+        ('sacks', 'sacks', 'gamesPlayed'),
+        ('qb_hits', 'QBHits', 'gamesPlayed'),
+        ('tackles_for_loss', 'tacklesForLoss', 'gamesPlayed'),
+        ('stuffs', 'stuffs', 'gamesPlayed'),
+    ),
+}
+
+
+def position_group(position: str) -> str:
+    """The FILTERS group of a position, None for positions without stats
+    """
+    if position in ('quarterback', 'running back', 'wide receiver', 'tight end'):
+        return position
+    elif position in Lists.secondary_positions:
+        return 'secondary'
+    elif position in Lists.defense_positions:
+        return 'defense'
+    return None
+
+
+def starter_plays(stats: Dict, depth_chart: Dict, teams) -> Dict:
+    """Looks up the totalOffensivePlays of each team's starting quarterback
+
+    Returns:
+        Dict: team -> plays, 0 when the team or its starter has no stats
+    """
+    plays = {}
+    for team in teams:
+        try:
+            plays[team] = stats[depth_chart[team]['quarterback']["1"]['id']].get(
+                'totalOffensivePlays')
+        except KeyError:
+            plays[team] = 0
+    return plays
+
+
+def filter_league(stats: Dict, details: Dict, depth_chart: Dict = None) -> Dict:
+    """filter_stats for every player with details at once. Each raw stat
+    the FILTERS need becomes a float column over all the players (NaN when
+    missing) and every ratio is divided a column at a time, with a missing
+    or zero divisor giving 0 the way filter_stats' validate does.
+
+    Args:
+        stats (Dict): ESPN ID -> stat name -> value, also where the
+        starting quarterbacks' plays are looked up
+        details (Dict): ESPN ID -> player details
+        depth_chart (Dict, optional): Files.DEPTH_CHART when omitted
+
+    Returns:
+        Dict: ESPN ID -> filtered stats, in the order of stats
+    """
+    depth_chart = Files.DEPTH_CHART if depth_chart is None else depth_chart
+    filtered, groups, positions = {}, {}, {}
+    for player in stats:
+        if not details.get(player):
+            continue
+        position = details[player]['position']
+        if position not in positions:
+            positions[position] = position_group(position)
+        filtered[player] = {}
+        groups.setdefault(positions[position], []).append(player)
+    groups.pop(None, None)
+    plays = starter_plays(stats, depth_chart, {
+        details[player]['team'] for members in groups.values() for player in members})
+
+    for group, members in groups.items():
+        rows = [stats[player] for player in members]
+        columns = {}
+
+        def column(name):
+            if name not in columns:
+                if name == 'qb_plays':
+                    values = [plays[details[player]['team']] for player in members]
+                elif name == 'targets':
+                    values = np.nan_to_num(column('receivingTargets'))
+                elif name == 'touches':
+                    values = column('targets') + np.nan_to_num(column('rushingAttempts'))
+                else:
+                    values = [row.get(name) for row in rows]
+                columns[name] = np.asarray(values, dtype=float)
+            return columns[name]
+
+        values = []
+        for _, numerator, divisor in FILTERS[group]:
+            if divisor is None:
+                values.append([row.get(numerator) for row in rows])
+                continue
+            a = column(numerator)
+            b = column(divisor) if isinstance(divisor, str) else float(divisor)
+            valid = ~np.isnan(a) & ~np.isnan(b) & (b != 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = (a / b).astype(object)
+            ratio[~valid] = 0
+            values.append(ratio.tolist())
+        keys = [key for key, _, _ in FILTERS[group]]
+        for player, row in zip(members, zip(*values)):
+            filtered[player] = dict(zip(keys, row))
+    return filtered
+
+
+class TeamAggregates:
+    """ProcessStats for every team at once. The active depth chart slots
+    become a player table (team, role) built once per roster, and each set
+    of filtered stats is joined to it and summed per team with bincount, in
+    slot order so the totals match ProcessStats' running sums exactly.
+    Rosters are reused across weeks, so every historical week's filtered
+    stats can be aggregated against one table.
+    """
+
+    METRICS = ['quarterback', 'receiving', 'rushing', 'passing_defense', 'rushing_defense']
+    PASSING_DEFENSE = ['interceptions', 'sacks', 'qb_hits', 'passes_defended']
+    RUSHING_DEFENSE = ['fumbles', 'tackles', 'tackles_for_loss', 'stuffs']
+
+    def __init__(self, roster: RosterIndex,
+                 statuses: Tuple[str, ...] = ('healthy', 'questionable')):
+        """
+        Args:
+            roster (RosterIndex): the league's depth charts and statuses
+            statuses (Tuple[str, ...]): the statuses of athletes who count
+        """
+        self.teams = roster.teams
+        self.starters = [roster.starter(team) for team in self.teams]
+        self.ids, self.team_index, roles = [], [], []
+        for i, team in enumerate(self.teams):
+            for slot in roster.active(team, statuses):
+                self.ids.append(slot.id)
+                self.team_index.append(i)
+                roles.append(self.role(slot.position, slot.depth))
+        self.team_index = np.array(self.team_index, dtype=np.intp)
+        self.roles = np.array(roles)
+
+    @staticmethod
+    def role(position: str, depth: str) -> str:
+        """Which ProcessStats setter a depth chart slot goes through. Every
+        slot that isn't a rusher, receiver or starting quarterback counts
+        toward the defense, as process_stats always has, so an athlete
+        without defensive stats adds 0.
+        """
+        if position in ['tight end', 'running back']:
+            return 'rushing'
+        elif position == 'wide receiver':
+            return 'receiving'
+        elif position == 'quarterback' and depth == "1":
+            return 'quarterback'
+        return 'defense'
+
+    def aggregate(self, stats: Dict) -> Dict:
+        """Computes the five team metrics ProcessStats does
+
+        Args:
+            stats (Dict): ESPN ID -> filtered stats, like db/filtered_stats.json
+
+        Returns:
+            Dict: team -> metric -> value, like processed_stats.json[week]
+        """
+        counted = np.array([bool(stats.get(id)) for id in self.ids], dtype=bool)
+        rows = [stats[id] for id, keep in zip(self.ids, counted) if keep]
+        teams = self.team_index[counted]
+        roles = self.roles[counted]
+
+        def column(stat, mask):
+            # ProcessStats._get_stat: a missing or falsy stat counts as 0.0
+            return np.array([row.get(stat) or 0.0 for row, keep in zip(rows, mask) if keep],
+                            dtype=float)
+
+        def team_sum(values, mask):
+            # bincount adds in slot order, the same order ProcessStats does
+            return (np.bincount(teams[mask], values, len(self.teams)),
+                    np.bincount(teams[mask], minlength=len(self.teams)) > 0)
+
+        totals = {}
+        mask = roles == 'rushing'
+        impact = column('rushing_yds_per_game', mask)
+        totals['rushing'] = team_sum(impact - impact * (
+            column('rushing_fumbles_pct', mask) + column('stuffs_pct', mask)), mask)
+
+        mask = roles == 'receiving'
+        interception_pct = np.array([
+            ((stats.get(qb.id) or {}).get('interception_pct') or 0.0) if qb else 0.0
+            for qb in self.starters], dtype=float)[teams[mask]]
+        impact = column('receiving_yds_per_game', mask)
+        totals['receiving'] = team_sum(
+            impact - impact * (column('play_pct', mask) * interception_pct), mask)
+
+        mask = roles == 'quarterback'
+        impact = column('passing_yds_per_game', mask) + column('rush_yds_per_game', mask)
+        totals['quarterback'] = team_sum(impact - impact * (
+            column('stuffs_pct', mask) + column('interception_pct', mask)), mask)
+
+        mask = roles == 'defense'
+        for metric, group in (('passing_defense', self.PASSING_DEFENSE),
+                              ('rushing_defense', self.RUSHING_DEFENSE)):
+            value = 0
+            for stat in group:
+                value = value + column(stat, mask)
+            totals[metric] = team_sum(value, mask)
+
+        # a metric no athlete added to keeps ProcessStats' int 0
+        columns = [[value if added else 0 for value, added in
+                    zip(totals[metric][0].tolist(), totals[metric][1].tolist())]
+                   for metric in self.METRICS]
+        return {team: dict(zip(self.METRICS, values))
+                for team, values in zip(self.teams, zip(*columns))}
+
+    def aggregate_weeks(self, weekly: Dict) -> Dict:
+        """aggregate for several weeks' filtered stats against this roster
+
+        Args:
+            weekly (Dict): week -> ESPN ID -> filtered stats
+
+        Returns:
+            Dict: week -> team -> metric -> value
+        """
+        return {week: self.aggregate(stats) for week, stats in weekly.items()}
+
+
+BENCHMARK = 90  # benchmark_stats.json holds this percentile of every stat
+
+
+def stat_table(stats: Dict, positions: Dict) -> Tuple[List[Tuple[str, str]], np.ndarray, np.ndarray]:
+    """Flattens filtered stats into a long table, one row for each of a
+    player's stats that has a value, grouped by position and stat
+
+    Args:
+        stats (Dict): ESPN ID -> filtered stats
+        positions (Dict): ESPN ID -> position, of the players to include
+
+    Returns:
+        Tuple: the (position, stat) of each group, in the order they first
+        appear, then each row's group and value
+    """
+    groups, index, codes, values = [], {}, [], []
+    for player, row in stats.items():
+        if not row or player not in positions:
+            continue
+        position = positions[player]
+        for stat, value in row.items():
+            if (position, stat) not in index:
+                index[(position, stat)] = len(groups)
+                groups.append((position, stat))
+            if value is not None:
+                codes.append(index[(position, stat)])
+                values.append(value)
+    codes, values = np.array(codes, dtype=np.intp), np.array(values, dtype=float)
+    kept = values == values
+    return groups, codes[kept], values[kept]
+
+
+def grouped_percentiles(groups: List[Tuple[str, str]], codes: np.ndarray, values: np.ndarray,
+                        percentiles: List[float]) -> Dict:
+    """Every group's percentiles from one sort of the whole table, linearly
+    interpolated with the same arithmetic as numpy.percentile (and so
+    pandas' quantile)
+
+    Args:
+        groups (List[Tuple[str, str]]): each group's (position, stat)
+        codes (np.ndarray): each row's group
+        values (np.ndarray): each row's value
+        percentiles (List[float]): e.g. [50, 90]
+
+    Returns:
+        Dict: position -> stat -> 'p50' etc. -> value, NaN for a group
+        without values
+    """
+    order = np.lexsort((values, codes))
+    values = values[order]
+    counts = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+    last = np.maximum(counts - 1, 0)
+
+    columns = {}
+    for percentile in percentiles:
+        virtual = (counts - 1) * np.true_divide(percentile, 100)
+        previous = np.clip(np.floor(virtual), 0, last).astype(np.intp)
+        following = np.minimum(previous + 1, last)
+        gamma = virtual - previous
+        if len(values):
+            a, b = values[starts + previous], values[starts + following]
+        else:
+            a = b = np.zeros(len(groups))
+        # numpy's _lerp, interpolating from whichever end is closer
+        difference = b - a
+        result = np.where(gamma >= 0.5, b - difference * (1 - gamma), a + difference * gamma)
+        columns[f'p{percentile:g}'] = np.where(counts > 0, result, np.nan).tolist()
+
+    table = {}
+    for i, (position, stat) in enumerate(groups):
+        table.setdefault(position, {})[stat] = {
+            name: column[i] for name, column in columns.items()}
+    return table
+
+
+def rank_against(population: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Percentile ranks of values among a sorted population, the inverse of
+    the linear interpolation grouped_percentiles uses: a value ranks above
+    p exactly when it's above the population's p'th percentile
+
+    Returns:
+        np.ndarray: ranks from 0 to 100, NaN for NaN values
+    """
+    n = len(population)
+    below = np.searchsorted(population, values, 'left')
+    at_or_below = np.searchsorted(population, values, 'right')
+    lower = population[np.clip(below - 1, 0, n - 1)]
+    upper = population[np.clip(below, 0, n - 1)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # a value in the population ranks where its first copy sits,
+        # between two values it ranks by how far it is from the lower one
+        position = np.where(at_or_below > below, below,
+                            below - 1 + (values - lower) / (upper - lower))
+    ranks = 100 * position / max(n - 1, 1)
+    ranks = np.where((below == 0) & (at_or_below == 0), 0.0, ranks)
+    ranks = np.where(below == n, 100.0, ranks)
+    return np.where(values == values, ranks, np.nan)
+
+
+def percentile_ranks(stats: Dict, positions: Dict, population: Dict) -> Dict:
+    """Ranks every player's filtered stats within their position
+
+    Args:
+        stats (Dict): ESPN ID -> filtered stats
+        positions (Dict): ESPN ID -> position, of every player to rank
+        population (Dict): ESPN ID -> position, of the players each
+        position is ranked against, the same ones the benchmarks come from
+
+    Returns:
+        Dict: position -> {'stats': names, 'players': ESPN IDs, 'ranks': a
+        row of ranks per player}, None where a player has no value or the
+        position has no values to rank against
+    """
+    groups, codes, values = stat_table(stats, population)
+    values = values[np.lexsort((values, codes))]
+    counts = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+    index = {group: i for i, group in enumerate(groups)}
+
+    players = {}
+    for player, row in stats.items():
+        if row and player in positions:
+            players.setdefault(positions[player], []).append(player)
+
+    table = {}
+    for position, ids in players.items():
+        names = list(dict.fromkeys(stat for player in ids for stat in stats[player]))
+        matrix = np.array([[stats[player].get(stat) for stat in names] for player in ids],
+                          dtype=float)
+        ranks = np.full(matrix.shape, np.nan)
+        for j, stat in enumerate(names):
+            group = index.get((position, stat))
+            if group is not None and counts[group]:
+                ranks[:, j] = rank_against(
+                    values[starts[group]:starts[group] + counts[group]], matrix[:, j])
+        table[position] = {'stats': names, 'players': ids, 'ranks': [
+            [None if rank != rank else rank for rank in row] for row in ranks.tolist()]}
+    return table
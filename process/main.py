@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
-from lib.db_utils import ReadWrite, GetData
-from lib.constants import Maps, Lists, Files, Inputs
-import update.data_formatting as formatter
+from lib.db_utils import ReadWrite, GetData, configure_from, shared_client, sqlite_store, use_sqlite
+from lib.constants import Files, Inputs, RunContext, Settings
+from lib.roster import RosterIndex
+from lib.scheduler import Scheduler, Stage, save_timestamps
+from lib.sketch import KLLSketch
+from update.roster_sync import sync_rosters
+from typing import Dict
 import process.data_processing as process
+import numpy as np
 import pandas as pd
 import sys
 import datetime
@@ -14,64 +19,46 @@ def filter_stats() -> None:
     filters them into a select, more manageable amount of stats
     """
 
-    details = Files.DETAILS
-    stats = Files.STATS
-    filtered_stats = {}
-    for player in stats:
-        if not details.get(player):
-            continue
-        team = details[player]['team']
-        position = details[player]['position']
-        filtered_stats[player] = process.filter_stats(
-            stats.get(player), position, team)
+    # nothing to do when none of the inputs changed since the last filter
+    sources = [ReadWrite(f'./db/{name}.json').digest()
+               for name in ('stats', 'player_details', 'depth_chart')]
+    try:
+        filtered = ReadWrite(FILTERED_SOURCES).read()
+    except FileNotFoundError:
+        filtered = None
+    if filtered == sources:
+        print("Stats unchanged, filtering skipped")
+        return None
+
+    filtered_stats = process.filter_league(
+        Files.STATS, Files.DETAILS, Files.DEPTH_CHART)
     ReadWrite('./db/filtered_stats.json', filtered_stats).write()
+    ReadWrite(FILTERED_SOURCES, sources).write()
     Files.TIMESTAMPS['filtered_stats'] = str(datetime.datetime.today())
     print("Stats filtered")
 
 
-def process_stats() -> None:
+def process_stats(ctx: RunContext = None) -> None:
     """Iterates through a team's depth chart and uses each players
     filtered stats to aggregate a team's overall performance
     """
-    stats = Files.FILTERED_STATS
-    depth_charts = Files.DEPTH_CHART
-    details = Files.DETAILS
+    ctx = ctx or RunContext.current()
     processed_stats = Files.PROCESSED_STATS
-    processed_stats[str(Inputs.WEEK)] = {}
-    for team in depth_charts:
-        ps = process.ProcessStats(team, stats)
-        for position in depth_charts[team]:
-            for depth in depth_charts[team][position]:
-                id = depth_charts[team][position][depth].get('id')
-                if details.get(id):
-                    status = details[id].get('status')
-                else:
-                    continue
-                if not stats.get(id) or (status != 'healthy' and status != 'questionable'):
-                    continue
-                if position in ['tight end', 'running back']:
-                    ps.set_rushing(id)
-                elif position in ['tight end', 'wide receiver']:
-                    ps.set_receiving(id)
-                elif position == 'quarterback' and depth == "1":
-                    ps.set_quarterback(id)
-                elif position in Lists.secondary_positions or Lists.defense_positions:
-                    ps.set_passing_defense(id)
-                    ps.set_rushing_defense(id)
-        processed_stats[str(Inputs.WEEK)
-                        ][team] = ps.get_processed_stats()
+    processed_stats[str(ctx.WEEK)] = process.TeamAggregates(
+        RosterIndex.load()).aggregate(Files.FILTERED_STATS)
     ReadWrite('./db/processed_stats.json', processed_stats).write()
     Files.TIMESTAMPS['processed_stats'] = str(datetime.datetime.today())
     print("Stats processed")
 
 
-def rank_teams() -> None:
+def rank_teams(ctx: RunContext = None) -> None:
     """Iterates through the processed stats to sort and rank each team 
     by their performance in each metric
     """
+    ctx = ctx or RunContext.current()
     metrics = ["quarterback", "receiving", "rushing",
                "passing_defense", "rushing_defense"]
-    stats = Files.PROCESSED_STATS.get(str(Inputs.WEEK))
+    stats = Files.PROCESSED_STATS.get(str(ctx.WEEK))
     stat_dict = {}
     for metric in metrics:
         stat_dict[metric] = {}
@@ -96,32 +83,6 @@ def process_injuries() -> None:
     status and creates a new dataset containing all the information 
     around that player's injury
     """
-    def update_db():
-        # Get latest depth chart info
-        depth_charts = {}
-        teams = Maps.TEAM_IDS
-        progress = [0, len(teams)]
-        for team in teams:
-            progress[0] += 1
-            sys.stdout.write(
-                f"{progress[0]} out of {progress[1]} team depth charts complete \t\r")
-            sys.stdout.flush()
-            url = f'{Inputs.URL}2022/teams/{teams.get(team)}/depthcharts'
-            depth_charts[team] = formatter.depth_chart(
-                GetData(url).query())
-        ReadWrite('db/depth_chart.json', depth_charts).write()
-        Files.TIMESTAMPS['depth_chart'] = str(datetime.datetime.today())
-
-        # Get latest player details
-        player_details = {}
-        for team in depth_charts:
-            for position in depth_charts.get(team):
-                for rank in depth_charts[team][position]:
-                    player_details[depth_charts[team][position][rank].get('id')] = formatter.player_details(
-                        data=depth_charts[team][position][rank], team=team, position=position, rank=rank)
-        ReadWrite('./db/player_details.json', player_details).write()
-        Files.TIMESTAMPS['player_details'] = str(datetime.datetime.today())
-
     # check run time config to see if data is recent
     update_time = datetime.datetime.strptime(
         Files.TIMESTAMPS['depth_chart'], '%Y-%m-%d %H:%M:%S.%f')
@@ -129,9 +90,9 @@ def process_injuries() -> None:
     # check to see if the data is older than 1 day
     if datetime.datetime.today() > update_time + datetime.timedelta(days=1):
         print("Depth chart and player details out of date")
-        update_db()
+        sync_rosters()
         print("Depth chart and player details updated")
-        ReadWrite('./db/timestamps.json', Files.TIMESTAMPS).write()
+        save_timestamps()
 
     details = Files.DETAILS
     injuries = {}
@@ -144,6 +105,8 @@ def process_injuries() -> None:
         if details[player]['status'] != 'healthy':
             additional_info = GetData(
                 details[player].get('ref')).query()
+            if not additional_info:
+                shared_client().metrics.record_empty('injury details', [player])
             if additional_info.get('details'):
                 body_part = additional_info['details'].get('type')
                 return_date = additional_info['details'].get('returnDate')
@@ -178,29 +141,22 @@ def process_defense_performance() -> None:
     """
     defense_performances = {}
     results = Files.RESULTS
-    depth_chart = Files.DEPTH_CHART
+    roster = RosterIndex.load()
+    # skip week 4 since there are no stats for week 3
+    weeks = {team: [week for week in results[team] if week != "4"] for team in results}
+    history = process.StatHistory([int(week) for team in weeks for week in weeks[team]])
 
     # iterate through each team in the results file
     for team in results:
         performances = []
         # iterate through each week's results for that team
-        for week in results[team]:
-            # skip week 4 since there are no stats for week 3
-            if week == "4":
-                continue
-
-            # get the opponent from that game
-            opponent = results[team][week].get('opponent')
-            # create StatDelta object for that week
-            stat_deltas = process.StatDeltas(week)
-
-            for position in depth_chart[opponent]:
-                for depth in depth_chart[opponent][position]:
-                    id = depth_chart[opponent][position][depth].get('id')
-                    stat_deltas.set_rushing(id)
-                    stat_deltas.set_receiving(id)
-            # append that week's object to the list
-            performances.append(stat_deltas.get_stat_deltas())
+        for week in weeks[team]:
+            # the opponent's offense gained that week is what the defense gave up
+            opponent = [slot.id for slot in roster.team(results[team][week].get('opponent'))]
+            performances.append({
+                'rushing': history.total(week, opponent, 'rushingYards'),
+                'receiving': history.total(week, opponent, 'receivingYards'),
+            })
 
         df = pd.DataFrame(performances)
         defense_performances[team] = {
@@ -221,60 +177,110 @@ def process_defense_performance() -> None:
     print("Defense performance processed")
 
 
-def process_benchmarks() -> None:
-    """Iterates through the filtered stats to sort each player's stats
-    by position and then calculates to find the 90th percentile for 
-    each stat
-    """
-    # BUG: this keeps breaking because for some reason, the filtered stats
-    # function needs to run twice. The first time, there are stats that exist there
-    # after the depth chart changes and they are no longer playing with a team
+def benchmark_population(stats: Dict) -> Dict:
+    """The players benchmarks are taken from and ranks are relative to
 
-    stats = Files.FILTERED_STATS
+    Returns:
+        Dict: ESPN ID -> position
+    """
+    store = sqlite_store()
+    # avoid low outliers by omitting any player deeper than 3rd string
+    if store:
+        return store.players_by_depth(3)
     details = Files.DETAILS
+    return {player: details[player].get('position') for player in stats
+            if stats.get(player) and int(details[player].get('depth')) < 4}
 
-    # A dictionary containing lists for each player's value for each stat
-    stats_by_position = {}
-    for player in stats:
-        # avoid low outliers by omitting any player deeper than 3rd string
-        if stats.get(player) and int(details[player].get('depth')) < 4:
-            if not stats_by_position.get(details[player].get('position')):
-                stats_by_position[details[player].get('position')] = []
-            stats_by_position[details[player]
-                              ['position']].append(stats[player])
-
-    # a dictionary with the 90th percentile value for each stat
-    benchmarks = {}
-    for position in stats_by_position:
-        df = pd.DataFrame(stats_by_position[position])
-        if not df.empty:
-            benchmarks[position] = {}
-            for col in df:
-                data = df[col].dropna()
-                benchmarks[position][col] = data.quantile(q=0.9)
+
+def process_benchmarks(ctx: RunContext = None) -> None:
+    """Groups every player's filtered stats by position and stat and finds
+    each group's percentiles in one pass: the 90th percentile for
+    benchmark_stats.json and every Settings.BENCHMARK_PERCENTILES for
+    benchmark_percentiles.json. With Settings.BENCHMARK_SKETCHES the week is
+    also folded into each group's running quantile sketch
+    """
+    ctx = ctx or RunContext.current()
+    stats = Files.FILTERED_STATS
+    groups, codes, values = process.stat_table(stats, benchmark_population(stats))
+    percentiles = process.grouped_percentiles(
+        groups, codes, values, sorted({process.BENCHMARK, *Settings.BENCHMARK_PERCENTILES}))
+    benchmark = f'p{process.BENCHMARK:g}'
+    benchmarks = {position: {stat: value[benchmark] for stat, value in percentiles[position].items()}
+                  for position in percentiles}
 
     ReadWrite('./db/benchmark_stats.json', benchmarks).write()
+    ReadWrite('./db/benchmark_percentiles.json', percentiles).write()
+    if Settings.BENCHMARK_SKETCHES:
+        update_benchmark_sketches(ctx, groups, codes, values)
     Files.TIMESTAMPS['benchmarks'] = str(datetime.datetime.today())
     print("Benchmarks processed")
 
 
+def update_benchmark_sketches(ctx: RunContext, groups: list, codes, values) -> None:
+    """Folds a week's stat table into db/benchmark_sketches.json, a KLL
+    sketch per position and stat kept across weeks and seasons, and writes
+    the percentiles of everything folded in so far to
+    db/benchmark_history.json. A week already folded in is skipped.
+    """
+    try:
+        history = ReadWrite(SKETCHES).read()
+    except FileNotFoundError:
+        history = {'weeks': [], 'sketches': {}}
+    week = f'{ctx.YEAR}_week_{ctx.WEEK}'
+    if week not in history['weeks']:
+        order = np.argsort(codes, kind='stable')
+        for (position, stat), group in zip(groups, np.split(
+                values[order], np.cumsum(np.bincount(codes, minlength=len(groups)))[:-1])):
+            sketches = history['sketches'].setdefault(position, {})
+            sketch = KLLSketch.from_dict(sketches[stat]) if stat in sketches else KLLSketch()
+            sketch.extend(group.tolist())
+            sketches[stat] = sketch.to_dict()
+        history['weeks'].append(week)
+        ReadWrite(SKETCHES, history).write()
+
+    percentiles = sorted({process.BENCHMARK, *Settings.BENCHMARK_PERCENTILES})
+    ReadWrite('./db/benchmark_history.json', {
+        position: {stat: dict(zip((f'p{p:g}' for p in percentiles),
+                                  KLLSketch.from_dict(sketch).quantiles(
+                                      [p / 100 for p in percentiles])))
+                   for stat, sketch in sketches.items()}
+        for position, sketches in history['sketches'].items()}).write()
+
+
+def rank_athletes() -> None:
+    """Ranks every player's filtered stats from 0 to 100 within their
+    position, against the same players the benchmarks come from, and
+    writes the ranks by position to db/percentile_ranks.json
+    """
+    stats = Files.FILTERED_STATS
+    details = Files.DETAILS
+    positions = {player: details[player].get('position') for player in stats if stats.get(player)}
+    ranks = process.percentile_ranks(stats, positions, benchmark_population(stats))
+    ReadWrite('./db/percentile_ranks.json', ranks).write()
+    Files.TIMESTAMPS['percentile_ranks'] = str(datetime.datetime.today())
+    print("Athletes ranked")
+
+
 def identify_top_athletes() -> None:
-    """References the benchmark stats to compare players against the 
-    90th percentile for each stat and then creates a new dataset to 
-    list those players and the stats they are elite in. This also includes
-    negative stats, so "top athletes" is a bit of a misnomber
+    """Lists the players ranked above the 90th percentile of their position
+    in db/percentile_ranks.json, so above the benchmark, and the stats they
+    are elite in. This also includes negative stats, so "top athletes" is a
+    bit of a misnomber
     """
     stats = Files.FILTERED_STATS
-    benchmarks = Files.BENCHMARKS
     details = Files.DETAILS
+    ranks = {}
+    for table in ReadWrite('./db/percentile_ranks.json').read().values():
+        for player, row in zip(table['players'], table['ranks']):
+            ranks[player] = dict(zip(table['stats'], row))
+
     top_athletes = {}
     for player in stats:
-        for stat in stats[player]:
-            if not top_athletes.get(stat):
-                top_athletes[stat] = {}
-            benchmark = benchmarks[details[player].get('position')][stat]
-            player_stat = stats[player][stat]
-            if stats[player].get(stat) and player_stat > benchmark:
+        for stat, player_stat in stats[player].items():
+            top_athletes.setdefault(stat, {})
+            # None when the player's position has no benchmark for the stat
+            rank = ranks.get(player, {}).get(stat)
+            if player_stat and rank is not None and rank > process.BENCHMARK:
                 top_athletes[stat][player] = {"name": details[player].get(
                     'name'), "position": details[player].get('position'), "stat": player_stat}
 
@@ -283,56 +289,44 @@ def identify_top_athletes() -> None:
     print("Top athletes identified")
 
 
-def process_offensive_line_performance() -> None:
+def process_offensive_line_performance(ctx: RunContext = None) -> None:
     """Quanitfies the effectiveness of the offensive line through the 
     amount of rush yards gained by the offense and sacks on the qb
     """
+    ctx = ctx or RunContext.current()
     o_line_performance = ReadWrite(
         './db/offensive_line_performance.json').read()
 
     # Won't overwrite
-    if o_line_performance.get(str(Inputs.WEEK)):
+    if o_line_performance.get(str(ctx.WEEK)):
         return None
 
-    o_line_performance[str(Inputs.WEEK)] = {}
+    o_line_performance[str(ctx.WEEK)] = {}
 
     # Reference the static depth chart updated at the beginning of the week
     # so any mid week changes aren't reflected
-    depth_chart = ReadWrite(
-        f'./db/{Inputs.YEAR}_depth_charts/week_{Inputs.WEEK}.json').read()
+    roster = RosterIndex(ReadWrite(
+        f'./db/{ctx.YEAR}_depth_charts/week_{ctx.WEEK}.json').read())
 
-    for team in depth_chart:
+    history = process.StatHistory([ctx.WEEK], ctx.YEAR)
+    for team in roster.teams:
         # continue if the team didn't have a game that week
-        if not Files.RESULTS[team].get(str(Inputs.WEEK)):
+        if not Files.RESULTS[team].get(str(ctx.WEEK)):
             continue
-        opponent = Files.RESULTS[team][str(Inputs.WEEK)].get('opponent')
-
-        o_line_performance[str(Inputs.WEEK)][team] = {}
-        sd = process.StatDeltas(Inputs.WEEK)
+        opponent = Files.RESULTS[team][str(ctx.WEEK)].get('opponent')
 
         # populate first string offensive linemen
-        offensive_lineman = {}
-        for position in depth_chart.get(team):
-            if position in Lists.offensive_line:
-                offensive_lineman[position] = depth_chart[team][position]["1"].get(
-                    'id')
-
-            # get team's rushing performance
-            for depth in depth_chart[team][position]:
-                sd.set_rushing(depth_chart[team][position][depth].get('id'))
-
-        # get sacks on QB
-        for position in depth_chart[opponent]:
-            if position in Lists.defense_positions:
-                for depth in depth_chart[opponent][position]:
-                    sd.set_sacks(depth_chart[opponent]
-                                 [position][depth].get('id'))
-
-        stat_deltas = sd.get_stat_deltas()
-        o_line_performance[str(Inputs.WEEK)][team] = {
+        offensive_lineman = {slot.position: slot.id for slot in roster.group(
+            team, 'offensive line') if slot.depth == "1"}
+
+        o_line_performance[str(ctx.WEEK)][team] = {
             'offensive_lineman': offensive_lineman,
-            'offense_rushing': stat_deltas.get('rushing'),
-            'qb_sacks': stat_deltas.get('sacks')
+            # team's rushing performance
+            'offense_rushing': history.total(
+                ctx.WEEK, [slot.id for slot in roster.team(team)], 'rushingYards'),
+            # sacks on QB
+            'qb_sacks': history.total(
+                ctx.WEEK, [slot.id for slot in roster.group(opponent, 'defense')], 'sacks')
         }
 
     ReadWrite('./db/offensive_line_performance.json',
@@ -340,22 +334,66 @@ def process_offensive_line_performance() -> None:
     print("Offensive Line performance processed")
 
 
+SKETCHES = './db/benchmark_sketches.json'
+# the digests of the files filtered_stats.json was last filtered from
+FILTERED_SOURCES = './db/filtered_stats.sources.json'
+WEEKLY_STATS = f'{Inputs.YEAR}_stats'
+WEEKLY_DEPTH_CHARTS = f'{Inputs.YEAR}_depth_charts'
+
+# in the order they ran before they were scheduled, see lib.scheduler
+STAGES = [
+    Stage('process_injuries', process_injuries,
+          inputs=('depth_chart.json', 'player_details.json', 'athletes.json'),
+          outputs=('depth_chart.json', 'player_details.json', 'athletes.json', 'injuries.json')),
+    Stage('filter_stats', filter_stats,
+          inputs=('stats.json', 'player_details.json', 'depth_chart.json'),
+          outputs=('filtered_stats.json', 'filtered_stats.sources.json')),
+    Stage('process_benchmarks', process_benchmarks,
+          inputs=('filtered_stats.json', 'player_details.json', 'benchmark_sketches.json'),
+          outputs=('benchmark_stats.json', 'benchmark_percentiles.json',
+                   'benchmark_sketches.json', 'benchmark_history.json')),
+    Stage('rank_athletes', rank_athletes,
+          inputs=('filtered_stats.json', 'player_details.json'),
+          outputs=('percentile_ranks.json',)),
+    Stage('identify_top_athletes', identify_top_athletes,
+          inputs=('filtered_stats.json', 'percentile_ranks.json', 'player_details.json'),
+          outputs=('top_athletes.json',)),
+    Stage('process_stats', process_stats,
+          inputs=('filtered_stats.json', 'depth_chart.json', 'player_details.json',
+                  'processed_stats.json'),
+          outputs=('processed_stats.json',)),
+    Stage('process_offensive_line_performance', process_offensive_line_performance,
+          inputs=('offensive_line_performance.json', 'results.json', WEEKLY_DEPTH_CHARTS,
+                  WEEKLY_STATS),
+          outputs=('offensive_line_performance.json',)),
+    Stage('process_defense_performance', process_defense_performance,
+          inputs=('results.json', 'depth_chart.json', 'player_details.json', WEEKLY_STATS),
+          outputs=('defense_performance.json',)),
+    Stage('rank_teams', rank_teams,
+          inputs=('processed_stats.json',),
+          outputs=('weekly_ranks.json',)),
+]
+
+
 def main():
     """Use this module to process the stats that are added through the 
     update module. This condenses the massive amount of stats and aggregates
     them into somethng more manageable while also providing new datasets 
     that can be used for analysis
+
+    To Run: python3 -m process.main [--only STAGE ...] [--from STAGE] [--list]
     """
-    process_injuries()
-    filter_stats()
-    process_benchmarks()
-    identify_top_athletes()
-    process_stats()
-    process_offensive_line_performance()
-    process_defense_performance()
-    rank_teams()
-
-    ReadWrite('./db/timestamps.json', Files.TIMESTAMPS).write()
+    args = Scheduler.arguments('Process the stats added by the update module')
+    if args.list:
+        Scheduler('process', STAGES).list()
+        return
+    if Settings.BACKEND == 'sqlite':
+        use_sqlite(Settings.SQLITE)
+    configure_from(Settings)
+    Scheduler('process', STAGES, Settings.STAGE_WORKERS).main(args)
+    save_timestamps()
+    print(shared_client().report())
+    print(f"Metrics saved to {shared_client().metrics.save('process')}")
 
 
 if __name__ == "__main__":
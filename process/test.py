@@ -1,7 +1,16 @@
 import unittest
 import process.data_processing as process
+import process.main as process_main
 from lib.db_utils import ReadWrite
-from lib.constants import Lists
+from lib.constants import Files, Lists
+from lib.roster import RosterIndex
+from lib.columnar import WeeklySnapshot
+from lib.testing import InTempDir
+from unittest import mock
+import json
+import os
+import numpy as np
+import pandas as pd
 
 
 class TestProcessing(unittest.TestCase):
@@ -134,6 +143,178 @@ class TestProcessing(unittest.TestCase):
         expected = ReadWrite('./process/mocks/filtered_stats.json').read()
         self.assertEqual(test, expected)
 
+    def test_filter_league(self):
+        details = ReadWrite('./process/mocks/player_details.json').read()
+        depth_chart = ReadWrite('./process/mocks/depth_chart.json').read()
+        stats = ReadWrite('./process/mocks/week_6.json').read()
+        # a player without stats, a zero divisor and a team without a depth chart
+        first = next(player for player in stats if details.get(player))
+        stats[first] = {}
+        receiver = next(player for player, detail in details.items()
+                        if detail['position'] == 'wide receiver' and player in stats)
+        stats[receiver]['receptions'] = 0
+        details['0'] = {'team': 'nowhere', 'position': 'tight end'}
+        stats['0'] = {'receivingTargets': 4, 'rushingAttempts': None}
+        with mock.patch.object(Files, 'STATS', stats), \
+                mock.patch.object(Files, 'DEPTH_CHART', depth_chart):
+            expected = {player: process.filter_stats(
+                stats[player], details[player]['position'], details[player]['team'])
+                for player in stats if details.get(player)}
+        test = process.filter_league(stats, details, depth_chart)
+        # json tells 0 from 0.0, the file written has to be the same too
+        self.assertEqual(json.dumps(test), json.dumps(expected))
+
+    def test_team_aggregates(self):
+        details = ReadWrite('./process/mocks/player_details.json').read()
+        team = ReadWrite('./process/mocks/depth_chart.json').read()
+        stats = process.filter_league(
+            ReadWrite('./process/mocks/week_6.json').read(), details, {'atlanta falcons': team})
+        # a second team with its rushers and receivers swapped and a player without stats
+        swapped = dict(team, **{'running back': team['wide receiver'],
+                                'wide receiver': team['running back'],
+                                'fullback': {'1': {'id': '0'}}})
+        details['0'] = {'status': 'healthy'}
+        roster = RosterIndex({'atlanta falcons': team, 'swapped': swapped}, details)
+        expected = {}
+        for name in roster.teams:
+            ps = process.ProcessStats(name, stats, roster.starter(name).id)
+            for slot in roster.active(name):
+                if not stats.get(slot.id):
+                    continue
+                if slot.position in ['tight end', 'running back']:
+                    ps.set_rushing(slot.id)
+                elif slot.position == 'wide receiver':
+                    ps.set_receiving(slot.id)
+                elif slot.position == 'quarterback' and slot.depth == "1":
+                    ps.set_quarterback(slot.id)
+                else:
+                    ps.set_passing_defense(slot.id)
+                    ps.set_rushing_defense(slot.id)
+            expected[name] = ps.get_processed_stats()
+        aggregates = process.TeamAggregates(roster)
+        self.assertEqual(json.dumps(aggregates.aggregate(stats)), json.dumps(expected))
+        self.assertEqual(aggregates.aggregate_weeks({'6': stats, '7': {}})['7']['swapped'],
+                         dict.fromkeys(aggregates.METRICS, 0))
+
+    def test_grouped_percentiles(self):
+        details = ReadWrite('./process/mocks/player_details.json').read()
+        stats = ReadWrite('./process/mocks/filtered_stats.json').read()
+        positions = {player: details[player]['position'] for player in stats}
+        table = process.grouped_percentiles(
+            *process.stat_table(stats, positions), [50, 90, 99])
+        by_position = {}
+        for player in stats:
+            if stats[player]:
+                by_position.setdefault(positions[player], []).append(stats[player])
+        expected = {}
+        for position, rows in by_position.items():
+            df = pd.DataFrame(rows)
+            expected[position] = {stat: {f'p{q}': df[stat].dropna().quantile(q=q / 100)
+                                         for q in (50, 90, 99)} for stat in df}
+        # the same keys in the same order and the same floats, NaN included
+        self.assertEqual(json.dumps(table), json.dumps(expected))
+
+    def test_rank_against(self):
+        population = np.sort(np.round(np.random.default_rng(7).normal(5, 2, 101), 1))
+        values = np.concatenate((population, population + 0.05, [-10, 20, np.nan]))
+        ranks = process.rank_against(population, values)
+        self.assertTrue(np.isnan(ranks[-1]))
+        for q in (50, 90, 99):
+            benchmark = pd.Series(population).quantile(q=q / 100)
+            # ranking above q is the same as beating the q'th percentile
+            self.assertEqual(list(ranks[:-1] > q), list(values[:-1] > benchmark))
+
+    def test_percentile_ranks(self):
+        stats = {'1': {'sacks': 2.0, 'tackles': None}, '2': {'sacks': 4.0, 'tackles': 3.0},
+                 '3': {'sacks': 3.0}, '4': {'sacks': 1.0}}
+        positions = dict.fromkeys(stats, 'nose tackle')
+        positions['4'] = 'punter'
+        table = process.percentile_ranks(stats, positions, {'1': 'nose tackle', '2': 'nose tackle'})
+        self.assertEqual(table['nose tackle'], {
+            'stats': ['sacks', 'tackles'], 'players': ['1', '2', '3'],
+            'ranks': [[0.0, None], [100.0, 0.0], [50.0, None]]})
+        # nobody to rank punters against
+        self.assertEqual(table['punter']['ranks'], [[None]])
+
+
+class TestStatHistory(InTempDir, unittest.TestCase):
+
+    def setUp(self):
+        week_6 = ReadWrite('./process/mocks/week_6.json').read()
+        week_7 = ReadWrite('./process/mocks/week_7.json').read()
+        super().setUp()
+        os.makedirs('db/2022_stats')
+        # an athlete only in week 7, one without stats in week 6 and one
+        # who didn't rush in week 6
+        self.ids = list(week_7)[:200] + ['0', '1', '2']
+        week_7.update({'0': {'rushingYards': 5.0}, '1': {'rushingYards': 7.0},
+                       '2': {'rushingYards': 9.0}})
+        week_6.update({'1': {}, '2': {'rushingYards': None, 'sacks': 1.0}})
+        self.weeks = {6: week_6, 7: week_7}
+        for week, stats in self.weeks.items():
+            ReadWrite(f'./db/2022_stats/week_{week}.json', stats).write()
+
+    def expected(self, stat):
+        # StatDeltas' original arithmetic, one athlete at a time
+        total = 0
+        for id in self.ids:
+            now, before = self.weeks[7].get(id), self.weeks[6].get(id)
+            if now and before:
+                if now.get(stat) and before.get(stat):
+                    total += now.get(stat) - before.get(stat)
+                elif now.get(stat):
+                    total += now.get(stat)
+        return total
+
+    def test_totals(self):
+        history = process.StatHistory([7], 2022)
+        for stat in ('rushingYards', 'receivingYards', 'sacks', 'passingYards'):
+            self.assertEqual(history.total(7, self.ids, stat), self.expected(stat))
+        self.assertEqual(history.total(7, ['1'], 'rushingYards'), 0)
+        self.assertEqual(history.total(7, ['2'], 'rushingYards'), 9.0)
+        self.assertEqual(history.totals({'team': self.ids}, 7, ['sacks']),
+                         {'team': {'sacks': self.expected('sacks')}})
+        sd = process.StatDeltas(7, 2022)
+        for id in self.ids:
+            sd.set_rushing(id)
+        self.assertEqual(sd.get_stat_deltas()['rushing'], self.expected('rushingYards'))
+
+    def test_columnar(self):
+        for week, stats in self.weeks.items():
+            WeeklySnapshot(f'./db/2022_stats/week_{week}.json').write(stats)
+        history = process.StatHistory([7], 2022)
+        self.assertEqual(history.total(7, self.ids, 'receivingYards'),
+                         self.expected('receivingYards'))
+        with self.assertRaises(FileNotFoundError):
+            process.StatHistory([6], 2022)
+        # a json rewritten after its columnar copy is read instead of the copy
+        self.weeks[7]['2'] = {'rushingYards': 19.0}
+        ReadWrite('./db/2022_stats/week_7.json', self.weeks[7]).write()
+        history = process.StatHistory.shared([7], 2022)
+        self.assertEqual(history.total(7, ['2'], 'rushingYards'), 19.0)
+
+
+class TestFilterStats(InTempDir, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('stats', 'player_details', 'depth_chart'):
+            ReadWrite(f'./db/{name}.json', {}).write()
+
+    def test_skip_unchanged(self):
+        timestamps = {}
+        with mock.patch.object(process, 'filter_league', return_value={}) as filter_league, \
+                mock.patch.object(Files, 'TIMESTAMPS', timestamps):
+            process_main.filter_stats()
+            process_main.filter_stats()
+            self.assertEqual(filter_league.call_count, 1)
+            ReadWrite('./db/stats.json', {'1': {}}).write()
+            process_main.filter_stats()
+            self.assertEqual(filter_league.call_count, 2)
+        # the source digests are kept apart from the timestamps
+        self.assertEqual(list(timestamps), ['filtered_stats'])
+        self.assertEqual(len(ReadWrite(process_main.FILTERED_SOURCES).read()), 3)
+
 
 if __name__ == "__main__":
     unittest.main()
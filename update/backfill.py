@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+from lib.db_utils import ReadWrite, configure_from, query_pages, shared_client, use_sqlite
+from lib.columnar import WeeklySnapshot
+from lib.constants import Inputs, Files, RunContext, Settings
+from update.main import fetch_results, fetch_schedule, update_stats
+from typing import Dict, List
+import update.data_formatting as formatter
+import argparse
+import os
+
+
+POSTSEASON_WEEKS = 5  # Wild Card, Divisional, Conference, Pro Bowl and Super Bowl
+
+
+def partition(ctx: RunContext, name: str) -> str:
+    """The per week file of a backfilled dataset, e.g. partition(ctx, 'results')
+    -> ./db/2021_results/week_5.json
+    """
+    return f'./db/{ctx.YEAR}_{name}/week_{ctx.WEEK}.json'
+
+
+def backfill_week(ctx: RunContext) -> Dict:
+    """Fetches one week's results and schedule into their partitions
+
+    Returns:
+        Dict: the week's results, team -> result
+    """
+    results = fetch_results(ctx)
+    for name, data in (('results', results), ('schedules', fetch_schedule(ctx))):
+        # a week whose scoreboard couldn't be read is left for the next backfill
+        if name == 'results' and not results:
+            continue
+        os.makedirs(os.path.dirname(partition(ctx, name)), exist_ok=True)
+        ReadWrite(partition(ctx, name), data).write()
+    return results
+
+
+def season_athletes(year: int, workers: int = Settings.WORKERS) -> Dict:
+    """Lists every athlete on a roster during a season
+
+    Returns:
+        Dict: ESPN ID -> {} (no depth chart details for past seasons)
+    """
+    athletes = query_pages({year: f'{Inputs.URL}{year}/athletes'}, workers=workers)[year]
+    return {formatter.athlete_id(item['$ref']): {} for item in athletes.get('items', [])}
+
+
+def written(path: str) -> bool:
+    """Whether a weekly stat snapshot is already in the db, as json or by column
+    """
+    try:
+        ReadWrite(path).version()
+        return True
+    except FileNotFoundError:
+        return WeeklySnapshot(path).exists()
+
+
+def snapshot_weeks(years: List[int], weeks: List[int]) -> List[RunContext]:
+    """Picks the week each season's stats snapshot is taken as of. ESPN only
+    serves season to date totals as they are today, so a snapshot is only
+    right as of Inputs' week of Inputs' season, or the final week of a past
+    season (its regular season's or postseason's, whichever was asked for)
+
+    Returns:
+        List[RunContext]: each season as of the last week asked for
+
+    Raises:
+        ValueError: the last week asked for isn't the week its totals are from
+    """
+    snapshots = []
+    for year in years:
+        ctx = RunContext(year, max(weeks))
+        if year > Inputs.YEAR:
+            raise ValueError(f"Can't snapshot {year} stats, the season hasn't started")
+        if year == Inputs.YEAR:
+            final = Inputs.WEEK
+        elif ctx.SEASON == 'postseason':
+            final = ctx.REGULAR_WEEKS + POSTSEASON_WEEKS
+        else:
+            final = ctx.REGULAR_WEEKS
+        if ctx.WEEK != final:
+            raise ValueError(f"Can't snapshot {year} stats as of week {ctx.WEEK}, "
+                             f"ESPN's totals are as of week {final}")
+        snapshots.append(ctx)
+    return snapshots
+
+
+def backfill(years: List[int], weeks: List[int], stats: bool = False,
+             workers: int = Settings.STAGE_WORKERS) -> None:
+    """Backfills every week in a range of seasons, a shard per week run at
+    the same time. Weeks of Inputs' season missing from db/results.json
+    are added to it.
+
+    Args:
+        years (List[int]): the seasons
+        weeks (List[int]): the weeks of each season, regular season weeks
+        first then the postseason's (week 19 is the 2021 Wild Card round),
+        weeks after Inputs' week are skipped
+        stats (bool): also snapshot each season's stats as of its last
+        week (see snapshot_weeks()), snapshots already written are kept
+        workers (int): how many weeks to fetch at once
+
+    Raises:
+        ValueError: stats were asked for as of a week ESPN's totals aren't from
+    """
+    snapshots = snapshot_weeks(years, weeks) if stats else []
+    # weeks that haven't been played yet would only get this week's data
+    shards = [RunContext(year, week) for year in years for week in weeks
+              if (year, week) <= (Inputs.YEAR, Inputs.WEEK)]
+    if len(shards) < len(years) * len(weeks):
+        print(f"Skipping weeks after {Inputs.YEAR} week {Inputs.WEEK}")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        weekly = dict(zip(shards, executor.map(backfill_week, shards)))
+    for ctx, results in weekly.items():
+        print(f"{ctx.YEAR} week {ctx.WEEK}: {len(results)} teams' results")
+    missing = [f'{ctx.YEAR} week {ctx.WEEK}' for ctx, results in weekly.items() if not results]
+    if missing:
+        print(f"No results for {', '.join(missing)}, backfill them again later")
+
+    current = {ctx: results for ctx, results in weekly.items()
+               if ctx.YEAR == Inputs.YEAR and results}
+    if current:
+        merged = Files.RESULTS
+        for ctx, results in current.items():
+            for team, result in results.items():
+                merged.setdefault(team, {}).setdefault(str(ctx.WEEK), result)
+        ReadWrite('./db/results.json', merged).write()
+
+    for ctx in snapshots:
+        if written(ctx.stats_path()):
+            print(f"{ctx.stats_path()} already exists, keeping it")
+            continue
+        athletes = season_athletes(ctx.YEAR) if ctx.YEAR != Inputs.YEAR else None
+        update_stats(Settings.WORKERS, incremental=False, ctx=ctx, athletes=athletes)
+        print(f"{ctx.YEAR} stats snapshot written to {ctx.stats_path()}")
+
+
+def main():
+    """To Run: python3 -m update.backfill --years 2021 2022 --weeks 1 18 --stats
+        Fetches the results and schedule of every week in the range into
+        db/{YEAR}_results/ and db/{YEAR}_schedules/, and with --stats each
+        season's stats into db/{YEAR}_stats/
+    """
+    parser = argparse.ArgumentParser(
+        description='Backfill results, schedules and stats for past weeks')
+    parser.add_argument('--years', type=int, nargs='+', required=True)
+    parser.add_argument('--weeks', type=int, nargs=2, default=[1, 18],
+                        metavar=('FIRST', 'LAST'))
+    parser.add_argument('--stats', action='store_true')
+    parser.add_argument('--workers', type=int, default=Settings.STAGE_WORKERS)
+    args = parser.parse_args()
+    if Settings.BACKEND == 'sqlite':
+        use_sqlite(Settings.SQLITE)
+    configure_from(Settings)
+    weeks = list(range(args.weeks[0], args.weeks[1] + 1))
+    if args.stats:
+        try:
+            snapshot_weeks(args.years, weeks)
+        except ValueError as error:
+            parser.error(str(error))
+    backfill(args.years, weeks, args.stats, args.workers)
+    print(shared_client().report())
+    print(f"Metrics saved to {shared_client().metrics.save('backfill')}")
+
+
+if __name__ == "__main__":
+    main()
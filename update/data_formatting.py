@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 
-from typing import Dict
+from bs4 import SoupStrainer
+from typing import Dict, List
 from lib.constants import Inputs, Files, Lists
-from lib.db_utils import GetData
+from lib.db_utils import query_all
+import re
 
 
-def schedule(data: str) -> Dict:
+# the only tags schedule() reads, see GetData.scrape
+SCHEDULE_TAGS = SoupStrainer(['h4', 'table'])
+
+
+def schedule(data: List, season: str = None) -> Dict:
     """Formats the raw HTML pulled from the CBS sports weekend
     schedule. Sorts through each day and parses out the teams
     playing in each match. 
 
     Args:
-        data (str): raw HTML from CBS sports
+        data (List): the day headings (h4 tags) of the CBS sports schedule
+        page, e.g. GetData(url).scrape(SCHEDULE_TAGS).find_all('h4')
+        season (str, optional): 'regular' or 'postseason', Inputs.SEASON
+        when omitted
 
     Returns:
         Dict: Each day in the weekend contains a list of lists for 
@@ -19,29 +28,87 @@ def schedule(data: str) -> Dict:
         city names. NOTE: This can be mapped to the CITY_FULL map in 
         lib.constants to provide eachfull team name. 
     """
-
-    match_ups = []
+    season = season or Inputs.SEASON
+    match_dict = {}
     for day in data:
         date = day.text.split('\n')[2].strip()
         games_table = day.find_next('tbody')
-        games = games_table.find_all('tr')
-        for game in games:
+        games = match_dict.setdefault(date, [])
+        for game in games_table.find_all('tr'):
             teams = game.find_all('span', class_='TeamName')
-            if Inputs.SEASON == 'regular':
-                match_ups.append([date, teams[0].text, teams[1].text])
-            elif Inputs.SEASON == 'postseason':
-                match_ups.append([date, teams[0].text.split(
-                    '\n')[-1].strip(), teams[1].text.split('\n')[-1].strip()])
-        dates = set([day[0] for day in match_ups])
-        match_dict = {date: [] for date in dates}
+            if season == 'regular':
+                games.append([teams[0].text.lower(), teams[1].text.lower()])
+            elif season == 'postseason':
+                games.append([teams[0].text.split('\n')[-1].strip().lower(),
+                              teams[1].text.split('\n')[-1].strip().lower()])
+    return match_dict
 
-    for match in match_ups:
-        match_dict[match[0]].append([match[1].lower(), match[2].lower()])
 
-    return match_dict
+def athlete_refs(data: Dict) -> List[str]:
+    """Collects the reference link of every athlete listed in a team's
+    depth chart, without duplicates and in the order they are listed
 
+    Args:
+        data (Dict): an object containing the entire query for a team's
+        depth chart (refer to mocks/raw_depth_chart.json)
 
-def depth_chart(data: Dict) -> Dict:
+    Returns:
+        List[str]: the unique athlete reference links
+    """
+    refs = []
+    for items in data['items']:
+        for position in items.get('positions'):
+            for athlete in items['positions'][position]['athletes']:
+                refs.append(athlete['athlete']['$ref'])
+    return list(dict.fromkeys(refs))
+
+
+def athlete_slots(data: Dict) -> Dict:
+    """Lists where each athlete appears in a team's depth chart
+
+    Args:
+        data (Dict): an object containing the entire query for a team's
+        depth chart (refer to mocks/raw_depth_chart.json)
+
+    Returns:
+        Dict: athlete reference link -> list of [position, rank] pairs
+    """
+    slots = {}
+    for items in data['items']:
+        for position in items.get('positions'):
+            name = items['positions'][position]['position'].get(
+                'displayName').lower()
+            for athlete in items['positions'][position]['athletes']:
+                slots.setdefault(athlete['athlete']['$ref'], []).append(
+                    [name, str(athlete['rank'])])
+    return slots
+
+
+def athlete_id(ref: str) -> str:
+    """Pulls the ESPN ID out of an athlete reference link, None if it has none
+    """
+    match = re.search(r'/athletes/(\d+)', ref)
+    return match.group(1) if match else None
+
+
+def roster_athletes(data: Dict) -> Dict:
+    """Sorts through a team's roster (site.api.espn.com/.../teams/{id}/roster),
+    which lists every athlete on the team in full
+
+    Args:
+        data (Dict): an object containing the entire query for a team's roster
+
+    Returns:
+        Dict: ESPN ID -> athlete, each with an id, displayName and injuries
+    """
+    athletes = {}
+    for group in data.get('athletes', []):
+        for athlete in group.get('items', []):
+            athletes[str(athlete.get('id'))] = athlete
+    return athletes
+
+
+def depth_chart(data: Dict, players: Dict = None) -> Dict:
     """Sorts through the positions in a team's depth chart or organize
     dictionaries in the order of position -> depth -> athlete details. 
     Athlete details include: name, status, injury date, and ESPN ID.
@@ -49,6 +116,8 @@ def depth_chart(data: Dict) -> Dict:
     Args:
         data (Dict): an object containing the entire query for a team's
         depth chart (refer to mocks/raw_depth_chart.json)
+        players (Dict, optional): athlete reference link -> queried athlete.
+        When omitted, every unique athlete in the chart is fetched in one batch
 
     Returns:
         Dict: each team's formatted depth chart
@@ -66,6 +135,8 @@ def depth_chart(data: Dict) -> Dict:
             "position b": {...}
         }
     """
+    if players is None:
+        players = query_all({ref: ref for ref in athlete_refs(data)})
 
     depth_chart = {}
     for items in data['items']:
@@ -74,8 +145,10 @@ def depth_chart(data: Dict) -> Dict:
                 'displayName').lower()
             depth_chart[position_name] = {}
             for athlete in items['positions'][position]['athletes']:
-                player = GetData(athlete['athlete']['$ref']
-                                 ).query()
+                player = players.get(athlete['athlete']['$ref'])
+                if not player:
+                    # the athlete couldn't be fetched, leave their slot empty
+                    continue
                 status = 'healthy'
                 date = None
                 ref = None
@@ -85,7 +158,7 @@ def depth_chart(data: Dict) -> Dict:
                     ref = player["injuries"][0].get('$ref')
 
                 depth_chart[position_name][str(athlete['rank'])] = {
-                    "name": player.get("displayName").lower(),
+                    "name": (player.get("displayName") or "").lower(),
                     "status": status,
                     "injury date": date,
                     "ref": ref,
@@ -191,3 +264,23 @@ def results(data: dict) -> Dict:
         count = 0
 
     return results
+
+
+def box_score_athletes(data: Dict) -> Dict:
+    """Lists the athletes who recorded at least one stat in a game
+
+    Args:
+        data (Dict): an object containing the entire query for a game's
+        summary (site.api.espn.com/.../nfl/summary?event={id})
+
+    Returns:
+        Dict: team name -> set of ESPN IDs with a line in that team's box score
+    """
+    athletes = {}
+    for team in data.get('boxscore', {}).get('players', []):
+        name = team['team'].get('displayName').lower()
+        athletes[name] = set()
+        for category in team.get('statistics', []):
+            for athlete in category.get('athletes', []):
+                athletes[name].add(str(athlete['athlete'].get('id')))
+    return athletes
@@ -1,93 +1,214 @@
 #!/usr/bin/env python3
 
-from lib.db_utils import GetData, ReadWrite
-from lib.constants import Inputs, Maps, Files
+from lib.db_utils import GetData, ReadWrite, configure_from, query_all, shared_client, use_sqlite
+from lib.constants import Inputs, Files, RunContext, Settings
+from lib.columnar import WeeklySnapshot
+from lib.journal import Journal
+from lib.scheduler import Scheduler, Stage, save_timestamps
+from update.roster_sync import sync_rosters
+from typing import Dict, List, Set
 import update.data_formatting as formatter
 import datetime
+import os
 import sys
 
+SCOREBOARD_URL = 'https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard'
+SUMMARY_URL = 'https://site.api.espn.com/apis/site/v2/sports/football/nfl/summary?event={}'
+JOURNAL = './db/journal/update_{}_week_{}.jsonl'
 
-def update_schedule() -> None:
+
+def scoreboard_url(ctx: RunContext) -> str:
+    return (f'{SCOREBOARD_URL}?dates={ctx.YEAR}&seasontype={ctx.SEASON_VAL}'
+            f'&week={ctx.SEASON_WEEK}')
+
+
+def fetch_schedule(ctx: RunContext) -> Dict:
+    """Scrapes the cbs sports website for the schedule of a run's week
+
+    Returns:
+        Dict: the week's games, see update.data_formatting.schedule
+    """
+    url = f'https://www.cbssports.com/nfl/schedule/{ctx.YEAR}/{ctx.SEASON}/{ctx.WEEK}/'
+    return formatter.schedule(
+        GetData(url).scrape(formatter.SCHEDULE_TAGS).find_all('h4'), ctx.SEASON)
+
+
+def update_schedule(ctx: RunContext = None) -> None:
     """Scrapes the cbs sports website to get the correct schedule for the week's
     game that is defined in lib.constants.
     """
-    url = f'https://www.cbssports.com/nfl/schedule/{Inputs.YEAR}/{Inputs.SEASON}/{Inputs.WEEK + 1}/'
+    ctx = ctx or RunContext.current()
     ReadWrite('db/schedule.json',
-              formatter.schedule(GetData(url).scrape().find_all('h4'))).write()
+              fetch_schedule(RunContext(ctx.YEAR, ctx.WEEK + 1))).write()
     Files.TIMESTAMPS['schedule'] = str(datetime.datetime.today())
 
 
-def update_depth_chart() -> None:
+def update_depth_chart(workers: int = Settings.WORKERS, journal: Journal = None) -> None:
     """Sorts through the positions on each team to populate athletes
     and their ESPN player ID into a depth chart based on their position rank.
+    Only athletes whose stored profile is stale are fetched again (see
+    update.roster_sync).
+
+    Args:
+        workers (int): how many requests to run concurrently
+        journal (Journal, optional): checkpoints each athlete as it's fetched
     """
-    depth_charts = {}
-    teams = Maps.TEAM_IDS
-    progress = [0, len(teams)]
-    for team in teams:
-        progress[0] += 1
-        sys.stdout.write(
-            f"{progress[0]} out of {progress[1]} team depth charts complete \t\r")
-        sys.stdout.flush()
-        url = f'{Inputs.URL}2022/teams/{teams.get(team)}/depthcharts'
-        depth_charts[team] = formatter.depth_chart(
-            GetData(url).query())
-    ReadWrite('db/depth_chart.json', depth_charts).write()
-    Files.TIMESTAMPS['depth_chart'] = str(datetime.date.today())
+    sync_rosters(workers, journal=journal)
+
 
+def unchanged_athletes(previous: Dict, workers: int = Settings.WORKERS,
+                       ctx: RunContext = None) -> Set[str]:
+    """Finds the athletes whose season to date stats can't have changed since
+    last week's snapshot: everyone on a team without a game this week, and
+    everyone missing from their team's box score. Teams whose box score
+    can't be read are assumed to have changed.
 
-def update_player_details() -> None:
-    """Sorts through the depth chart to build a separate dictionary that maps
-    an ESPN ID directly to that athlete's details.
+    Args:
+        previous (Dict): last week's stat snapshot
+        workers (int): how many box scores to fetch concurrently
+        ctx (RunContext, optional): the week, Inputs' when omitted
+
+    Returns:
+        Set[str]: the ESPN IDs whose stats can be carried forward
+    """
+    ctx = ctx or RunContext.current()
+    # results.json only holds Inputs' season
+    if ctx.YEAR != Inputs.YEAR:
+        return set()
+    events = GetData(scoreboard_url(ctx)).query().get('events', [])
+    box_scores = query_all({event['id']: SUMMARY_URL.format(event['id'])
+                            for event in events}, workers)
+    played = {}
+    for data in box_scores.values():
+        played.update(formatter.box_score_athletes(data))
+
+    results = Files.RESULTS
+    unchanged = set()
+    for athlete, details in Files.DETAILS.items():
+        team = details.get('team')
+        if athlete not in previous:
+            continue
+        if not results.get(team, {}).get(str(ctx.WEEK)):
+            unchanged.add(athlete)
+        elif team in played and athlete not in played[team]:
+            unchanged.add(athlete)
+    return unchanged
+
+
+def priority(details: Dict) -> Dict[str, int]:
+    """Ranks athletes for fetching: starters and anyone injured first,
+    then by depth
+
+    Args:
+        details (Dict): ESPN ID -> details, like db/player_details.json
+
+    Returns:
+        Dict: ESPN ID -> rank, lowest first
     """
-    player_details = {}
-    depth_chart = Files.DEPTH_CHART
-    for team in depth_chart:
-        for position in depth_chart.get(team):
-            for rank in depth_chart[team][position]:
-                player_details[depth_chart[team][position][rank].get('id')] = formatter.player_details(
-                    data=depth_chart[team][position][rank], team=team, position=position, rank=rank)
-    ReadWrite('./db/player_details.json', player_details).write()
-    Files.TIMESTAMPS['player_details'] = str(datetime.date.today())
-
-
-def update_stats() -> None:
+    return {athlete: 1 if details[athlete].get('status') not in (None, 'healthy')
+            else int(details[athlete].get('depth') or 99)
+            for athlete in details}
+
+
+def update_stats(workers: int = Settings.WORKERS, incremental: bool = Settings.INCREMENTAL,
+                 journal: Journal = None, ctx: RunContext = None, athletes: Dict = None) -> None:
     """Sorts through each athlete to get the latest stats based on the 
     season to date. 
+
+    Args:
+        workers (int): how many athletes to fetch concurrently
+        incremental (bool): only fetch athletes who played this week and
+        carry everyone else forward from last week's snapshot
+        journal (Journal, optional): checkpoints each athlete's stats as
+        they arrive, and athletes it already holds aren't fetched again
+        ctx (RunContext, optional): the week to snapshot, Inputs' when
+        omitted. db/stats.json is only replaced for Inputs' week
+        athletes (Dict, optional): ESPN ID -> details of the athletes to
+        fetch, db/player_details.json when omitted
     """
-    stats = {}
-    athletes = Files.DETAILS
-    progress = [0, len(athletes)]
-    for athlete in athletes:
-        progress[0] += 1
+    ctx = ctx or RunContext.current()
+
+    def checkpoint(athlete, data):
+        journal.record('stats', athlete, formatter.stats(data))
+
+    def progress(completed, total):
         sys.stdout.write(
-            f"Stat updates {'{0:.2g}'.format((progress[0] / progress[1]) * 100)}% complete \t\r")
+            f"Stat updates {'{0:.2g}'.format((completed / total) * 100)}% complete \t\r")
         sys.stdout.flush()
-        url = f'{Inputs.URL}{Inputs.YEAR}/types/{Inputs.SEASON_VAL}/athletes/{athlete}/statistics/0'
-        data = GetData(url).query()
-        if data:
-            stats[athlete] = formatter.stats(data)
-    ReadWrite('db/stats.json', stats).write()
-    ReadWrite(
-        f'db/{Inputs.YEAR}_stats/week_{Inputs.WEEK}.json', stats).write()
-    Files.TIMESTAMPS['stats'] = str(datetime.date.today())
 
+    athletes = Files.DETAILS if athletes is None else athletes
+    previous = {}
+    unchanged = set()
+    if incremental:
+        try:
+            previous = ReadWrite(ctx.stats_path(ctx.WEEK - 1)).read()
+        except FileNotFoundError:
+            print(f"No week {ctx.WEEK - 1} snapshot, fetching every athlete")
+        if previous:
+            unchanged = unchanged_athletes(previous, workers, ctx)
 
-def update_results():
-    """Sorts through each game of week and formatters the results
+    done = journal.done('stats') if journal else {}
+    urls = {
+        athlete: f'{Inputs.URL}{ctx.YEAR}/types/{ctx.SEASON_VAL}/athletes/{athlete}/statistics/0'
+        for athlete in athletes if athlete not in unchanged and athlete not in done
+    }
+    responses = query_all(urls, workers, progress,
+                          checkpoint if journal else None, priority(athletes))
+    stats = {}
+    for athlete in athletes:
+        if athlete in unchanged:
+            stats[athlete] = previous[athlete]
+        elif athlete in done:
+            stats[athlete] = done[athlete]
+        elif responses[athlete]:
+            stats[athlete] = formatter.stats(responses[athlete])
+    if incremental:
+        print(f"{len(unchanged)} of {len(athletes)} athlete stat requests skipped")
+    if done:
+        print(f"{len(done)} athletes' stats resumed from the journal")
+    missing = [athlete for athlete in urls if not responses[athlete]]
+    if missing:
+        shared_client().metrics.record_empty('athlete stats', missing)
+        print(f"No stats for {len(missing)} athletes, see the request summary for failures")
+    os.makedirs(os.path.dirname(ctx.stats_path()), exist_ok=True)
+    ReadWrite(ctx.stats_path(), stats).write()
+    if Settings.COLUMNAR:
+        WeeklySnapshot(ctx.stats_path()).write(stats)
+    if ctx == RunContext.current():
+        ReadWrite('db/stats.json', stats).write()
+        Files.TIMESTAMPS['stats'] = str(datetime.date.today())
+
+
+def fetch_results(ctx: RunContext) -> Dict:
+    """Formats the result of every game in a run's week
+
+    Returns:
+        Dict: team -> result, see update.data_formatting.results, empty
+        when the scoreboard can't be read
     """
-    data = GetData(
-        'https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard').query()
-    results = Files.RESULTS
-    for event in data['events']:
+    events = GetData(scoreboard_url(ctx)).query().get('events', [])
+    if not events:
+        shared_client().metrics.record_empty('scoreboards', [f'{ctx.YEAR} week {ctx.WEEK}'])
+        print(f"No games found for {ctx.YEAR} week {ctx.WEEK}")
+    week = {}
+    for event in events:
         competitions = event['competitions']
         for competition in competitions:
-            result = formatter.results(competition)
-            for team in result:
-                if results[team].get(str(Inputs.WEEK)):
-                    raise Exception(
-                        f"Can't overwrite week {Inputs.WEEK} results")
-                results[team][str(Inputs.WEEK)] = result[team]
+            week.update(formatter.results(competition))
+    return week
+
+
+def update_results(ctx: RunContext = None):
+    """Sorts through each game of week and formatters the results
+    """
+    ctx = ctx or RunContext.current()
+    results = Files.RESULTS
+    for team, result in fetch_results(ctx).items():
+        # rerunning the same week is fine, changing it isn't
+        if results[team].get(str(ctx.WEEK)) not in (None, result):
+            raise Exception(
+                f"Can't overwrite week {ctx.WEEK} results")
+        results[team][str(ctx.WEEK)] = result
     ReadWrite('./db/results.json', results).write()
     Files.TIMESTAMPS['results'] = str(datetime.date.today())
 
@@ -110,24 +231,61 @@ def time_check():
             f"Can't update outside of Monday evening or Tuesday")
 
 
+def stages(journal: Journal = None) -> List[Stage]:
+    """The update pipeline, each stage skipped when the journal says it
+    already finished and marked finished in it once it does
+    """
+    def journaled(stage, *args):
+        def run():
+            if journal.finished(stage.__name__):
+                print(f"{stage.__name__} already finished, skipped")
+                return
+            stage(*args)
+            save_timestamps()
+            journal.finish(stage.__name__)
+        return run
+
+    weekly_stats = f'{Inputs.YEAR}_stats'
+    return [
+        Stage('update_results', journaled(update_results),
+              inputs=('results.json',), outputs=('results.json',)),
+        Stage('update_schedule', journaled(update_schedule),
+              inputs=(), outputs=('schedule.json',)),
+        Stage('update_depth_chart', journaled(update_depth_chart, Settings.WORKERS, journal),
+              inputs=('athletes.json',),
+              outputs=('depth_chart.json', 'player_details.json', 'athletes.json')),
+        Stage('update_stats', journaled(update_stats, Settings.WORKERS, Settings.INCREMENTAL, journal),
+              inputs=('player_details.json', 'results.json', weekly_stats),
+              outputs=('stats.json', weekly_stats)),
+    ]
+
+
 def main():
     """To Run: python3 -m update.main
         Run this on Monday after the game or Tuesday before results are 
-        overwritten by ESPN
+        overwritten by ESPN. Takes [--only STAGE ...] [--from STAGE] [--list]
     """
-    time_check()
-    update_results()
-    print(f"Week {Inputs.WEEK} results updated")
-    update_schedule()
-    print(f"Week {Inputs.WEEK + 1} schedule updated")
-    update_depth_chart()
-    print("Depth Chart is updated")
-    update_player_details()
-    print('Player details are updated')
-    update_stats()
-    print('Stats are updated')
-    ReadWrite('./db/timestamps.json', Files.TIMESTAMPS).write()
+    args = Scheduler.arguments(
+        'Update the db with the week\'s results, schedule, rosters and stats')
+    if args.list:
+        Scheduler('update', stages()).list()
+        return
+    # replayed fixtures are complete whenever they're run
+    if Settings.HTTP_MODE != 'replay':
+        time_check()
+    if Settings.BACKEND == 'sqlite':
+        use_sqlite(Settings.SQLITE)
+    configure_from(Settings)
+    journal = Journal(JOURNAL.format(Inputs.YEAR, Inputs.WEEK))
+    if journal.resumed:
+        print(f"Resuming from {journal.path}")
 
+    pipeline = stages(journal)
+    Scheduler('update', pipeline, Settings.STAGE_WORKERS).main(args)
+    if all(journal.finished(stage.name) for stage in pipeline):
+        journal.clear()
+    print(shared_client().report())
+    print(f"Metrics saved to {shared_client().metrics.save('update')}")
 
 if __name__ == "__main__":
     main()
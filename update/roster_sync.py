@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+from lib.db_utils import ReadWrite, query_all, query_pages, shared_client
+from lib.constants import Inputs, Maps, Files, Settings
+from lib.journal import Journal
+from lib.roster import RosterIndex
+from typing import Dict
+import update.data_formatting as formatter
+import datetime
+import sys
+
+PROFILES = './db/athletes.json'
+ROSTER_URL = 'https://site.api.espn.com/apis/site/v2/sports/football/nfl/teams/{}/roster'
+
+
+def profile(player: Dict) -> Dict:
+    """Keeps the parts of a queried athlete the depth chart is built from
+
+    Args:
+        player (Dict): the query for an athlete's reference link
+
+    Returns:
+        Dict: the athlete's ID, display name and most recent injury
+    """
+    injuries = [{key: injury.get(key) for key in ('status', 'date', '$ref')}
+                for injury in (player.get('injuries') or [])[:1]]
+    return {'id': player.get('id'), 'displayName': player.get('displayName'),
+            'injuries': injuries}
+
+
+def injury_status(player: Dict) -> str:
+    """The status of an athlete's most recent injury, None when healthy
+    """
+    injuries = player.get('injuries') or []
+    return injuries[0].get('status') if injuries else None
+
+
+def changed(entry: Dict, athlete: Dict) -> bool:
+    """Decides whether an athlete's stored profile needs to be fetched again.
+    New athletes, profiles without a name, athletes missing from their
+    team's roster and athletes whose injury status on the roster differs
+    from their stored one are refetched.
+
+    Args:
+        entry (Dict): the athlete's entry in the profile store, if any
+        athlete (Dict): the athlete as listed on their team's roster, if any
+    """
+    if entry is None or athlete is None or not entry['profile'].get('displayName'):
+        return True
+    return injury_status(athlete) != injury_status(entry['profile'])
+
+
+def roster_athletes(workers: int = Settings.WORKERS) -> Dict:
+    """Reads every team's roster, one request per team. Rosters list each
+    athlete's injury status but don't link to the injury's details
+
+    Args:
+        workers (int): how many rosters to fetch concurrently
+
+    Returns:
+        Dict: ESPN ID -> athlete, for every athlete on a roster that was read
+    """
+    rosters = query_all({team: ROSTER_URL.format(Maps.TEAM_IDS.get(team))
+                         for team in Maps.TEAM_IDS}, workers)
+    athletes = {}
+    for team in rosters:
+        athletes.update(formatter.roster_athletes(rosters[team]))
+    return athletes
+
+
+def sync_rosters(workers: int = Settings.WORKERS, full: bool = False,
+                 journal: Journal = None) -> Dict:
+    """Refreshes the depth chart and player details. Every team's depth
+    chart listing and roster is read, then only the athletes whose stored
+    profile changed (see changed()) are refreshed, and everyone else is
+    built from the profile store in db/athletes.json. Changed athletes who
+    are healthy are taken from their roster, injured ones are fetched from
+    their own reference link, which has the injury details.
+
+    Args:
+        workers (int): how many requests to run concurrently
+        full (bool): refetch every athlete regardless of the profile store
+        journal (Journal, optional): checkpoints every athlete fetched, and
+        athletes it already holds aren't fetched again
+
+    Returns:
+        Dict: the new depth chart
+    """
+    def progress(completed, total):
+        sys.stdout.write(
+            f"{completed} out of {total} athlete profiles fetched \t\r")
+        sys.stdout.flush()
+
+    teams = Maps.TEAM_IDS
+    charts = query_pages({team: f'{Inputs.URL}{Inputs.YEAR}/teams/{teams.get(team)}/depthcharts'
+                          for team in teams}, workers=workers)
+    listing = {}
+    for team in charts:
+        for ref, slots in formatter.athlete_slots(charts[team]).items():
+            listing.setdefault(ref, []).extend(
+                [team, *slot] for slot in slots)
+
+    try:
+        store = {} if full else ReadWrite(PROFILES).read()
+    except FileNotFoundError:
+        store = {}
+    now = datetime.datetime.now()
+    athletes = roster_athletes(workers)
+    rostered = {ref: athletes.get(formatter.athlete_id(ref)) for ref in listing}
+    refs = [ref for ref in listing if changed(store.get(ref), rostered[ref])]
+    fetched = journal.done('rosters') if journal else {}
+    healthy = {ref: rostered[ref] for ref in refs if ref not in fetched
+               and rostered[ref] and not injury_status(rostered[ref])}
+    fetched.update(healthy)
+
+    def checkpoint(ref, player):
+        journal.record('rosters', ref, profile(player))
+
+    if journal:
+        for ref, player in healthy.items():
+            checkpoint(ref, player)
+    # starters and anyone injured first, then by depth
+    ranks = {ref: 1 if rostered[ref] and injury_status(rostered[ref])
+             else min(int(slot[2]) for slot in listing[ref]) for ref in refs}
+    fetched.update(query_all({ref: ref for ref in refs if ref not in fetched},
+                             workers, progress, checkpoint if journal else None, ranks))
+
+    profiles = {}
+    for ref in listing:
+        if fetched.get(ref):
+            profiles[ref] = {'profile': profile(fetched[ref]), 'slots': listing[ref],
+                             'fetched': now.isoformat()}
+        elif ref in store:
+            # keep the last known profile when it's unchanged or a refetch
+            # fails, an athlete who was never fetched is left off the depth chart
+            profiles[ref] = {**store[ref], 'slots': listing[ref]}
+    shared_client().metrics.record_empty(
+        'athlete profiles', [ref for ref in refs if not fetched.get(ref)])
+    print(f"{len(refs)} of {len(listing)} athlete profiles refreshed, "
+          f"{len(healthy)} from team rosters")
+
+    players = {ref: entry['profile'] for ref, entry in profiles.items()}
+    depth_charts = {team: formatter.depth_chart(charts[team], players)
+                    for team in charts}
+    player_details = {}
+    for slot in RosterIndex(depth_charts).slots:
+        player_details[slot.id] = formatter.player_details(
+            data=slot.data, team=slot.team, position=slot.position, rank=slot.depth)
+
+    ReadWrite(PROFILES, profiles).write()
+    ReadWrite('./db/depth_chart.json', depth_charts).write()
+    ReadWrite('./db/player_details.json', player_details).write()
+    Files.TIMESTAMPS['depth_chart'] = str(datetime.datetime.today())
+    Files.TIMESTAMPS['player_details'] = str(datetime.datetime.today())
+    return depth_charts
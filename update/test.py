@@ -2,17 +2,28 @@
 
 import unittest
 import update.data_formatting as format
-from lib.db_utils import GetData, ReadWrite
+from bs4 import BeautifulSoup
+from lib.db_utils import HTML_PARSER, ReadWrite
+from lib.constants import Files, Inputs, RunContext
+from lib.testing import InTempDir
+from unittest import mock
+import update.backfill as backfill
+import update.roster_sync as roster_sync
+import update.main as update_main
+import os
 
 
 class TestUpdates(unittest.TestCase):
 
-    def test_schedule(self):
-        url = 'https://www.cbssports.com/nfl/schedule/2022/regular/4/'
-        test = format.schedule(
-            GetData(url).scrape().find_all('h4'))
+    def test_schedule_tables(self):
+        with open('./update/mocks/raw_schedule.html', encoding='utf8') as hf:
+            page = hf.read()
+        test = format.schedule(BeautifulSoup(
+            page, HTML_PARSER, parse_only=format.SCHEDULE_TAGS).find_all('h4'), 'regular')
         expected = ReadWrite('./update/mocks/schedule.json').read()
         self.assertEqual(test, expected)
+        self.assertEqual(test, format.schedule(
+            BeautifulSoup(page, 'html.parser').find_all('h4'), 'regular'))
 
     def test_depth_chart(self):
         data = ReadWrite('./update/mocks/raw_depth_chart.json').read()
@@ -20,6 +31,29 @@ class TestUpdates(unittest.TestCase):
         expected = ReadWrite('./update/mocks/depth_chart.json').read()
         self.assertEqual(test, expected)
 
+    def test_depth_chart_missing_athletes(self):
+        data = ReadWrite('./update/mocks/raw_depth_chart.json').read()
+        refs = format.athlete_refs(data)
+        players = {ref: {'id': format.athlete_id(ref), 'displayName': 'name',
+                         'injuries': []} for ref in refs}
+        # one athlete's fetch failed, another's profile has no name
+        del players[refs[0]]
+        players[refs[1]]['displayName'] = None
+        test = format.depth_chart(data, players)['left defensive end']
+        self.assertNotIn('1', test)
+        self.assertEqual(test['2'], {'name': '', 'status': 'healthy', 'injury date': None,
+                                     'ref': None, 'id': '3134316'})
+
+    def test_athlete_slots(self):
+        data = ReadWrite('./update/mocks/raw_depth_chart.json').read()
+        test = format.athlete_slots(data)
+        self.assertEqual(list(test), format.athlete_refs(data))
+        chart = format.depth_chart(data, {ref: {'id': ref, 'displayName': ref}
+                                          for ref in test})
+        for ref, slots in test.items():
+            for position, rank in slots:
+                self.assertEqual(chart[position][rank]['id'], ref)
+
     def test_player_details(self):
         test = {}
         data = ReadWrite('./update/mocks/depth_chart.json').read()
@@ -42,6 +76,138 @@ class TestUpdates(unittest.TestCase):
         expected = ReadWrite('./update/mocks/results.json').read()
         self.assertEqual(test, expected)
 
+    def test_box_score_athletes(self):
+        data = {'boxscore': {'players': [
+            {'team': {'displayName': 'Atlanta Falcons'}, 'statistics': [
+                {'name': 'passing', 'athletes': [{'athlete': {'id': '4361370'}}]},
+                {'name': 'rushing', 'athletes': [{'athlete': {'id': '4361370'}},
+                                                 {'athlete': {'id': '4241478'}}]}]},
+            {'team': {'displayName': 'Carolina Panthers'}, 'statistics': []}]}}
+        test = format.box_score_athletes(data)
+        expected = {'atlanta falcons': {'4361370', '4241478'},
+                    'carolina panthers': set()}
+        self.assertEqual(test, expected)
+
+    def test_unchanged_athletes_past_season(self):
+        with mock.patch.object(update_main, 'GetData') as get_data:
+            test = update_main.unchanged_athletes({}, ctx=RunContext(Inputs.YEAR - 1, 7))
+        self.assertEqual(test, set())
+        get_data.assert_not_called()
+
+
+class TestBackfill(InTempDir, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        ReadWrite('./db/results.json', {'atlanta falcons': {}}).write()
+
+    def test_backfill(self):
+        fetched, snapshots = [], []
+
+        def results(ctx):
+            fetched.append(ctx)
+            return {'atlanta falcons': {'opponent': 'carolina panthers', 'week': ctx.WEEK}}
+
+        def stats(workers, incremental, ctx, athletes):
+            snapshots.append(ctx)
+
+        with mock.patch.object(backfill, 'fetch_results', results), \
+                mock.patch.object(backfill, 'fetch_schedule', lambda ctx: {}), \
+                mock.patch.object(backfill, 'season_athletes', lambda year: {}), \
+                mock.patch.object(backfill, 'update_stats', stats):
+            backfill.backfill([2021, Inputs.YEAR], list(range(1, 19)))
+            backfill.backfill([2021], list(range(1, 19)), stats=True)
+            backfill.backfill([Inputs.YEAR], list(range(1, Inputs.WEEK + 1)), stats=True)
+
+        # every 2021 week, the current season only up to Inputs.WEEK
+        self.assertEqual(sorted(set(fetched), key=lambda ctx: (ctx.YEAR, ctx.WEEK)),
+                         [RunContext(2021, week) for week in range(1, 19)] +
+                         [RunContext(Inputs.YEAR, week) for week in range(1, Inputs.WEEK + 1)])
+        self.assertEqual(ReadWrite('./db/2021_results/week_18.json').read(),
+                         {'atlanta falcons': {'opponent': 'carolina panthers', 'week': 18}})
+        self.assertFalse(os.path.exists(f'./db/{Inputs.YEAR}_results/week_{Inputs.WEEK + 1}.json'))
+        self.assertEqual(snapshots, [RunContext(2021, 18), RunContext(Inputs.YEAR, Inputs.WEEK)])
+        merged = ReadWrite('./db/results.json').read()['atlanta falcons']
+        self.assertEqual(sorted(merged, key=int), [str(week) for week in range(1, Inputs.WEEK + 1)])
+
+    def test_snapshot_weeks(self):
+        self.assertEqual(backfill.snapshot_weeks([2020], [1, 17]), [RunContext(2020, 17)])
+        self.assertEqual(backfill.snapshot_weeks([2021], [19, 23]), [RunContext(2021, 23)])
+        # season to date totals can't stand in for an earlier week
+        for years, weeks in (([Inputs.YEAR], [1, 5]), ([2021], [1, 17]),
+                             ([2021], [19, 20]), ([Inputs.YEAR + 1], [1, 18])):
+            with self.assertRaises(ValueError):
+                backfill.snapshot_weeks(years, weeks)
+
+    def test_keep_snapshots(self):
+        path = RunContext(2021, 18).stats_path()
+        os.makedirs(os.path.dirname(path))
+        ReadWrite(path, {'1': {'sacks': 1.0}}).write()
+        with mock.patch.object(backfill, 'fetch_results', lambda ctx: {}), \
+                mock.patch.object(backfill, 'fetch_schedule', lambda ctx: {}), \
+                mock.patch.object(backfill, 'update_stats') as update_stats:
+            backfill.backfill([2021], [18], stats=True)
+        update_stats.assert_not_called()
+        self.assertEqual(ReadWrite(path).read(), {'1': {'sacks': 1.0}})
+        # the week without results isn't written, so the next backfill retries it
+        self.assertFalse(os.path.exists('./db/2021_results/week_18.json'))
+
+
+class TestRosterSync(InTempDir, unittest.TestCase):
+
+    def setUp(self):
+        self.chart = ReadWrite('./update/mocks/raw_depth_chart.json').read()
+        super().setUp()
+
+    def test_changed(self):
+        healthy = {'displayName': 'name', 'injuries': []}
+        hurt = {'displayName': 'name', 'injuries': [{'status': 'Questionable'}]}
+        self.assertTrue(roster_sync.changed(None, healthy))
+        self.assertTrue(roster_sync.changed({'profile': healthy}, None))
+        self.assertTrue(roster_sync.changed({'profile': healthy}, hurt))
+        self.assertTrue(roster_sync.changed({'profile': hurt}, healthy))
+        self.assertTrue(roster_sync.changed(
+            {'profile': {'displayName': None, 'injuries': []}}, healthy))
+        self.assertFalse(roster_sync.changed({'profile': hurt}, hurt))
+        self.assertFalse(roster_sync.changed({'profile': healthy}, healthy))
+
+    def test_sync_rosters(self):
+        refs = format.athlete_refs(self.chart)
+        athletes = {format.athlete_id(ref): {'id': format.athlete_id(ref),
+                                             'displayName': 'name', 'injuries': []}
+                    for ref in refs}
+        store = {ref: {'profile': roster_sync.profile(athletes[format.athlete_id(ref)]),
+                       'slots': [], 'fetched': '2022-01-01T00:00:00'} for ref in refs}
+        # refs[0] got hurt since the last run, refs[1] is new
+        hurt = {'status': 'Questionable', 'date': '2022-01-02', '$ref': 'injury'}
+        athletes[format.athlete_id(refs[0])]['injuries'] = [{'status': 'Questionable'}]
+        del store[refs[1]]
+        ReadWrite(roster_sync.PROFILES, store).write()
+        requested = []
+
+        def query_all(urls, *args):
+            requested.append(urls)
+            if all('roster' in url for url in urls.values()):
+                return {team: {'athletes': [{'items': list(athletes.values())}]}
+                        for team in urls}
+            return {ref: {'id': format.athlete_id(ref), 'displayName': 'hurt',
+                          'injuries': [hurt]} for ref in urls}
+
+        with mock.patch.object(roster_sync, 'query_pages',
+                               lambda urls, workers: {'atlanta falcons': self.chart}), \
+                mock.patch.object(roster_sync, 'query_all', query_all), \
+                mock.patch.object(Files, 'TIMESTAMPS', {}):
+            roster_sync.sync_rosters(workers=1)
+
+        # only the athlete whose injury changed is fetched on their own
+        self.assertEqual(list(requested[-1]), [refs[0]])
+        profiles = ReadWrite(roster_sync.PROFILES).read()
+        self.assertEqual(profiles[refs[0]]['profile']['injuries'], [hurt])
+        self.assertEqual(profiles[refs[1]]['profile']['displayName'], 'name')
+        self.assertEqual(profiles[refs[2]]['fetched'], '2022-01-01T00:00:00')
+        details = ReadWrite('./db/player_details.json').read()
+        self.assertEqual(details[format.athlete_id(refs[0])]['status'], 'questionable')
+
 
 if __name__ == "__main__":
     unittest.main()